@@ -0,0 +1,40 @@
+from tabulate import tabulate
+import argparse
+import json
+
+
+KEY = ("edges_target", "edge_type", "store", "compact", "aggregate", "stage")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results across commits.")
+    parser.add_argument("results")
+    parser.add_argument("--metric", choices=["seconds", "peak_memory"], default="seconds")
+    args = parser.parse_args()
+    results = dict()
+    commits = []
+    results_file = open(args.results, "r", encoding="utf8")
+    for line in results_file:
+        record = json.loads(line)
+        if record[args.metric] is None:
+            continue
+        commit = (record["commit"] or "unknown")[:8] + ("+" if record["dirty"] else "")
+        if commit not in commits:
+            commits.append(commit)
+        # The best of the repeats is the least noisy estimate.
+        key = tuple(record[field] for field in KEY)
+        best = results.setdefault(key, dict())
+        best[commit] = min(best.get(commit, record[args.metric]), record[args.metric])
+    results_file.close()
+    rows = []
+    for key, values in results.items():
+        row = list(key) + [values.get(commit) for commit in commits]
+        if len(commits) > 1 and commits[0] in values and commits[-1] in values and values[commits[0]]:
+            row.append(f"{values[commits[-1]] / values[commits[0]]:.2f}x")
+        rows.append(row)
+    headers = list(KEY) + commits + (["last/first"] if len(commits) > 1 else [])
+    print(tabulate(rows, headers=headers, floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from benchmarks.run import ROOT, git_commit
+from datetime import datetime, timezone
+import subprocess
+import platform
+import argparse
+import json
+import sys
+import os
+
+
+STATEMENTS = {
+    "pypoll": "import pypoll",
+    "metrics": "from pypoll import metrics",
+    "Backend": "from pypoll import Backend",
+    "MongoDB": "from pypoll import MongoDB",
+    "ParquetStore": "from pypoll import ParquetStore",
+    "Graph": "from pypoll import Graph",
+    "Twitter": "from pypoll import Twitter",
+    "GraphPlot": "from pypoll import GraphPlot",
+    "SDK": "from pypoll import SDK"
+}
+HEAVY_MODULES = ("PyQt6", "flask", "waitress", "flask_cors", "tweepy", "pymongo", "networkx", "scipy", "pyarrow", "requests")
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "modules": len(sys.modules), "heavy": sorted(name for name in {heavy} if name in sys.modules)}}))
+"""
+
+
+def probe(statement):
+    # Every measurement runs in a fresh interpreter, otherwise the module cache hides the cost of the import.
+    code = PROBE.format(statement=statement, heavy=repr(HEAVY_MODULES))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        return None
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    # `-X importtime` writes "import time: self [us] | cumulative | imported package" lines to stderr.
+    cumulative = 0
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "pypoll":
+            cumulative = int(fields[1].strip())
+    result["pypoll_cumulative"] = cumulative / 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of PyPoll and of each of its subsystems.")
+    parser.add_argument("--names", nargs="+", choices=list(STATEMENTS), default=list(STATEMENTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail when `import pypoll` takes longer than this")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "imports.jsonl"))
+    args = parser.parse_args()
+    commit, dirty = git_commit()
+    context = {
+        "commit": commit, "dirty": dirty, "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(), "platform": platform.platform()
+    }
+    output = open(args.output, "a", encoding="utf8")
+    failed = False
+    for name in args.names:
+        best = None
+        for repeat in range(args.repeat):
+            result = probe(STATEMENTS[name])
+            if result is None:
+                break
+            output.write(json.dumps({**context, "name": name, "repeat": repeat, **result}) + "\n")
+            if best is None or result["seconds"] < best["seconds"]:
+                best = result
+        output.flush()
+        if best is None:
+            print(f"{name:<14} {'unavailable':>10}")
+            continue
+        print(f"{name:<14} {best['seconds'] * 1000:8.1f}ms {best['modules']:>6} modules  {', '.join(best['heavy']) or '-'}")
+        if name == "pypoll":
+            # The package itself must stay cheap: every heavy dependency belongs to a subsystem.
+            if len(best["heavy"]):
+                print(f"`import pypoll` loads {', '.join(best['heavy'])}")
+                failed = True
+            if args.max_seconds is not None and best["seconds"] > args.max_seconds:
+                print(f"`import pypoll` took {best['seconds']:.3f}s, more than {args.max_seconds:.3f}s")
+                failed = True
+    output.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
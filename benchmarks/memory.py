@@ -0,0 +1,118 @@
+from pypoll.dblib import Backend
+from datetime import datetime
+import threading
+
+
+class MemoryStore(Backend):
+    def __init__(self):
+        self.collections = dict()
+        self.ids = dict()
+        self.metadata = dict()
+        self.lock = threading.Lock()
+
+    def __documents(self, collection):
+        return self.collections.setdefault(collection, [])
+
+    @staticmethod
+    def __in_range(document, since=None, until=None):
+        created_at = document.get("created_at")
+        if since is not None and (created_at is None or created_at < since):
+            return False
+        if until is not None and (created_at is None or created_at > until):
+            return False
+        return True
+
+    def insert_many(self, collection, data, ordered=True):
+        with self.lock:
+            ids = self.ids.setdefault(collection, dict())
+            for document in data:
+                self.__documents(collection).append(dict(document))
+                if document.get("id") is not None:
+                    ids.setdefault(document["id"], self.__documents(collection)[-1])
+
+    def insert_new(self, collection, data):
+        ids = self.ids.get(collection, dict())
+        documents = dict()
+        for document in data:
+            if document["id"] not in ids and document["id"] not in documents:
+                documents[document["id"]] = document
+        self.insert_many(collection, list(documents.values()))
+        return len(documents)
+
+    def count_documents(self, collection, since=None, until=None):
+        return sum(1 for document in self.__documents(collection) if self.__in_range(document, since, until))
+
+    def get_created_date(self, collection, order="ASC"):
+        dates = [document["created_at"] for document in self.__documents(collection) if isinstance(document.get("created_at"), datetime)]
+        if not len(dates):
+            return None
+        return min(dates) if order == "ASC" else max(dates)
+
+    def update_metadata(self, username, cursor, next_cursor):
+        self.metadata[username] = {"username": username, "next_cursor": next_cursor, "cursor": cursor}
+
+    def get_cursor(self, username):
+        return self.metadata.get(username)
+
+    def get_all(self, collection, since=None, until=None, projection=None, batch_size=None, raw=False):
+        documents = [document for document in self.__documents(collection) if self.__in_range(document, since, until)]
+        documents.sort(key=lambda document: document.get("created_at") or datetime.min, reverse=True)
+        return iter(documents)
+
+    def exist_username(self, collection, username):
+        return any(document.get("username") == username for document in self.__documents(collection))
+
+    def get_usernames(self, collection):
+        return ({"username": document.get("username")} for document in self.__documents(collection))
+
+    def get_tweet(self, collection, tweet_id):
+        return self.ids.get(collection, dict()).get(tweet_id)
+
+    def get_tweets(self, collection, tweet_ids):
+        ids = self.ids.get(collection, dict())
+        return [ids[tweet_id] for tweet_id in tweet_ids if tweet_id in ids]
+
+    def __occurrences(self, collection, edge_type, since=None, until=None, exclude=None):
+        # Every appearance of a user in `get_all` order: the author of each tweet, then the users it mentions or references.
+        reference_type = {"retweet": "retweeted", "quote": "quoted"}.get(edge_type)
+        if edge_type != "mention" and reference_type is None:
+            raise Exception(f"Unknown edge type `{edge_type}`")
+        ids = self.ids.get(collection, dict())
+        for document in self.get_all(collection, since, until):
+            if exclude and document.get("id") in exclude:
+                continue
+            author = document.get("author", dict())
+            yield author.get("username"), author.get("public_metrics"), None, None
+            if edge_type == "mention":
+                for mention in document.get("entities", dict()).get("mentions", []):
+                    yield mention.get("username"), None, author.get("username"), document["created_at"]
+                continue
+            for reference in document.get("referenced_tweets", []):
+                tweet = ids.get(reference["id"]) if reference["type"] == reference_type else None
+                if tweet is not None:
+                    yield tweet["author"]["username"], tweet["author"].get("public_metrics"), author.get("username"), tweet["created_at"]
+
+    def aggregate_nodes(self, collection, edge_type, since=None, until=None, exclude=None):
+        # A user keeps the attributes of its last appearance, i.e. the oldest one.
+        nodes = dict()
+        for username, public_metrics, _, _ in self.__occurrences(collection, edge_type, since, until, exclude):
+            if username is not None:
+                nodes[username] = public_metrics
+        return ({"_id": username, "public_metrics": public_metrics} for username, public_metrics in nodes.items())
+
+    def aggregate_edges(self, collection, edge_type, since=None, until=None, exclude=None):
+        # An edge keeps the `created_at` of its first appearance, i.e. the newest one.
+        edges = dict()
+        for target, _, source, created_at in self.__occurrences(collection, edge_type, since, until, exclude):
+            if source is None or target is None:
+                continue
+            edge = edges.setdefault((source, target), {"weight": 0, "created_at": created_at})
+            edge["weight"] += 1
+        return (
+            {"_id": {"source": source, "target": target}, "weight": edge["weight"], "created_at": edge["created_at"]}
+            for (source, target), edge in edges.items()
+        )
+
+    def delete(self, collection):
+        self.collections.pop(collection, None)
+        self.ids.pop(collection, None)
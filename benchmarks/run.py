@@ -0,0 +1,132 @@
+from benchmarks.synthetic import SEED_USERS, populate
+from benchmarks.memory import MemoryStore
+from pypoll.dblib import MongoDB, ParquetStore
+from pypoll.graphlib import Graph
+from datetime import datetime, timezone
+import subprocess
+import tracemalloc
+import tempfile
+import platform
+import argparse
+import time
+import json
+import gc
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HASHTAG = "#benchmark"
+STAGES = ("populate", "create_graph", "fj", "rwc", "save_as", "load", "create_layout")
+COLORS = ({"r": 27, "g": 92, "b": 199, "a": 1}, {"r": 238, "g": 128, "b": 143, "a": 1})
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, len(status.strip()) > 0
+
+
+def measure(function, memory=True):
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - started
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def create_store(args, directory):
+    if args.store == "memory":
+        return MemoryStore()
+    elif args.store == "parquet":
+        return ParquetStore(os.path.join(directory, "store"))
+    elif args.store == "mongodb":
+        return MongoDB(args.mongodb_host, args.mongodb_db, args.mongodb_port)
+    raise Exception(f"Unknown store `{args.store}`")
+
+
+def run(args, edges, directory, write):
+    store = create_store(args, directory)
+    options = {
+        "edge_type": args.edge_type, "giant_component": False, "remove_leaf_nodes": False,
+        "users": list(SEED_USERS), "compact": args.compact, "aggregate": args.aggregate
+    }
+    graph = Graph()
+    stages = [
+        ("populate", lambda: populate(store, HASHTAG, edges, args.seed)),
+        ("create_graph", lambda: graph.create_graph(HASHTAG, store, options)),
+        ("fj", lambda: graph.get_polarization(["fj"])),
+        ("rwc", lambda: graph.get_polarization(["rwc"], {"seed": args.seed, "method": args.rwc_method}))
+    ]
+    for filetype in args.formats:
+        filename = os.path.join(directory, f"graph.{filetype}")
+        stages.append((f"save_as:{filetype}", lambda filename=filename: graph.save_as(filename)))
+        stages.append((f"load:{filetype}", lambda filename=filename: Graph().load(filename)))
+    layout = {
+        "scale": 1, "node_size": 2, "seed": args.seed, "iterations": args.layout_iterations,
+        "users": {user: {"full_name": user, "color": color} for user, color in zip(SEED_USERS, COLORS)}
+    }
+    stages.append(("create_layout", lambda: graph.create_layout(os.path.join(directory, "layout.gexf"), layout)))
+    for stage, function in stages:
+        if stage.split(":")[0] not in args.stages:
+            continue
+        for repeat in range(args.repeat if stage != "populate" else 1):
+            _, seconds, peak = measure(function, args.memory)
+            write({
+                "stage": stage, "repeat": repeat, "seconds": seconds, "peak_memory": peak,
+                "edges_target": edges, "edge_type": args.edge_type, "store": args.store, "seed": args.seed,
+                "compact": args.compact, "aggregate": args.aggregate,
+                "nodes": graph.get_number_of_nodes() if stage != "populate" else None,
+                "edges": graph.get_number_of_edges() if stage != "populate" else None
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PyPoll on synthetic polarized tweet data.")
+    parser.add_argument("--edges", type=int, nargs="+", default=[10000])
+    parser.add_argument("--edge-type", choices=["mention", "retweet", "quote"], default="mention")
+    parser.add_argument("--store", choices=["memory", "parquet", "mongodb"], default="memory")
+    parser.add_argument("--mongodb-host", default="localhost")
+    parser.add_argument("--mongodb-port", type=int, default=27017)
+    parser.add_argument("--mongodb-db", default="pypoll_benchmark")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--formats", nargs="+", default=["gexf", "json", "npz", "pypoll"])
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--aggregate", action="store_true")
+    parser.add_argument("--rwc-method", choices=["sampled", "exact"], default="sampled")
+    parser.add_argument("--layout-iterations", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="do not trace peak memory, which slows down pure Python stages")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.jsonl"))
+    args = parser.parse_args()
+    commit, dirty = git_commit()
+    context = {
+        "commit": commit, "dirty": dirty, "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(), "platform": platform.platform(), "traced_memory": args.memory
+    }
+    output = open(args.output, "a", encoding="utf8")
+
+    def write(record):
+        record = {**context, **record}
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        peak = f"{record['peak_memory'] / 2 ** 20:.1f} MiB" if record["peak_memory"] is not None else "-"
+        print(f"{record['edges_target']:>10} {record['stage']:<16} {record['seconds']:10.3f}s {peak:>12}")
+
+    for edges in args.edges:
+        with tempfile.TemporaryDirectory() as directory:
+            run(args, edges, directory, write)
+    output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+import numpy as np
+
+
+SEED_USERS = ("A", "B")
+START = datetime(2022, 1, 1)
+
+
+def _popularity(n, exponent, rng):
+    # Heavy-tailed activity: a few users write or are mentioned most of the time, like on Twitter.
+    weights = (np.arange(n) + 1.0) ** -exponent
+    return rng.permutation(weights / weights.sum())
+
+
+def _username(index):
+    return f"user{index}"
+
+
+def generate_followers(n_users, seed=0):
+    rng = np.random.default_rng([seed, 0])
+    # Users are split in two communities by parity, each mostly following one of the seed users.
+    community = np.arange(n_users) % 2
+    followers = dict()
+    for position, user in enumerate(SEED_USERS):
+        probability = np.where(community == position, 0.4, 0.05)
+        follows = np.flatnonzero(rng.random(n_users) < probability)
+        followers[user] = [{"id": str(index), "username": _username(index), "name": f"User {index}"} for index in follows]
+    return followers
+
+
+def generate_tweets(n_users, n_tweets, seed=0, batch_size=10000):
+    rng = np.random.default_rng([seed, 1])
+    community = np.arange(n_users) % 2
+    members = [np.flatnonzero(community == position) for position in range(2)]
+    authors_p = _popularity(n_users, 0.9, rng)
+    mentioned_p = [_popularity(len(members[position]), 1.1, rng) for position in range(2)]
+    metrics = rng.integers(0, 10000, size=(n_users, 4))
+    for offset in range(0, n_tweets, batch_size):
+        size = min(batch_size, n_tweets - offset)
+        authors = rng.choice(n_users, size, p=authors_p)
+        minutes = np.sort(rng.integers(0, 60 * 24, size)) + offset // batch_size * 60 * 24
+        n_mentions = np.where(rng.random(size) < 0.7, rng.integers(1, 4, size), 0)
+        # Mentions stay mostly within the author's own community, which makes the graph polarized.
+        mention_authors = np.repeat(authors, n_mentions)
+        groups = np.where(rng.random(len(mention_authors)) < 0.8, community[mention_authors], 1 - community[mention_authors])
+        mentions = np.empty(len(mention_authors), dtype=np.int64)
+        for group in range(2):
+            mentions[groups == group] = members[group][rng.choice(len(members[group]), np.count_nonzero(groups == group), p=mentioned_p[group])]
+        mention_offsets = np.concatenate([[0], np.cumsum(n_mentions)])
+        references = rng.random(size)
+        referenced = (rng.random(size) * np.arange(offset, offset + size)).astype(np.int64)
+        documents = []
+        for index in range(size):
+            tweet_id = offset + index
+            author = int(authors[index])
+            document = {
+                "id": str(tweet_id),
+                "text": f"Tweet {tweet_id} by {_username(author)} #benchmark",
+                "created_at": START + timedelta(minutes=int(minutes[index])),
+                "author_id": str(author),
+                "lang": "en",
+                "author": {
+                    "id": str(author), "username": _username(author), "name": f"User {author}",
+                    "public_metrics": dict(zip(("followers_count", "following_count", "tweet_count", "listed_count"), metrics[author].tolist()))
+                },
+                "public_metrics": {"retweet_count": 0, "reply_count": 0, "like_count": 0, "quote_count": 0}
+            }
+            if n_mentions[index]:
+                targets = mentions[mention_offsets[index]:mention_offsets[index + 1]].tolist()
+                document["entities"] = {"mentions": [{"start": 0, "end": 1, "username": _username(target), "id": str(target)} for target in targets]}
+            if tweet_id > 0 and references[index] < 0.5:
+                reference_type = "retweeted" if references[index] < 0.35 else "quoted"
+                document["referenced_tweets"] = [{"type": reference_type, "id": str(int(referenced[index]))}]
+            documents.append(document)
+        yield documents
+
+
+def populate(store, hashtag, edges, seed=0, batch_size=10000):
+    # About one mention edge per tweet, and about five tweets per user.
+    n_tweets = max(edges, 100)
+    n_users = max(n_tweets // 5, 100)
+    for user, followers in generate_followers(n_users, seed).items():
+        store.delete(user)
+        store.insert_many(user, followers)
+    store.delete(hashtag)
+    for documents in generate_tweets(n_users, n_tweets, seed, batch_size):
+        store.insert_many(hashtag, documents)
+    return {"users": n_users, "tweets": n_tweets}
@@ -1,5 +1,16 @@
-from .dblib import MongoDB
-from .graphlib import Graph
-from .twitterlib import Twitter
-from .graphplotlib import GraphPlot
-from .sdk import SDK
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["metrics", "Backend", "MongoDB", "ParquetStore", "Graph", "Twitter", "GraphPlot", "SDK"]
+# Subsystems are imported on first attribute access, so `import pypoll` does not load PyQt6, flask, tweepy,
+# pymongo or networkx until they are needed.
+__getattr__, __dir__ = lazy_module(__name__, {
+    "metrics": ".metricslib",
+    "Backend": ".dblib",
+    "MongoDB": ".dblib",
+    "ParquetStore": ".dblib",
+    "Graph": ".graphlib",
+    "Twitter": ".twitterlib",
+    "GraphPlot": ".graphplotlib",
+    "SDK": ".sdk"
+})
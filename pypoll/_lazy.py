@@ -0,0 +1,17 @@
+from importlib import import_module
+import sys
+
+
+def lazy_module(name, mapping):
+    # Returns the module `__getattr__` and `__dir__` (PEP 562) of a package whose exports are imported on first access.
+    def __getattr__(attribute):
+        if attribute in mapping:
+            value = getattr(import_module(mapping[attribute], name), attribute)
+            setattr(sys.modules[name], attribute, value)
+            return value
+        raise AttributeError(f"module {name!r} has no attribute {attribute!r}")
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[name])) | set(mapping))
+
+    return __getattr__, __dir__
@@ -1 +1,5 @@
-from .db import MongoDB
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["Backend", "MongoDB", "ParquetStore"]
+__getattr__, __dir__ = lazy_module(__name__, {"Backend": ".backend", "MongoDB": ".db", "ParquetStore": ".parquet"})
@@ -0,0 +1,66 @@
+from bson.raw_bson import RawBSONDocument
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+EXTENSIONS = {None: ".bson", "gzip": ".bson.gz", "zstd": ".bson.zst"}
+
+
+def archive_compression(filename):
+    if filename.endswith(".gz"):
+        return "gzip"
+    elif filename.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def archive_collection(filename):
+    name = os.path.basename(filename)
+    extension = EXTENSIONS[archive_compression(filename)]
+    if name.endswith(extension):
+        return name[:-len(extension)]
+    return name
+
+
+def open_archive(filename, mode, compression=None):
+    if compression == "zstd":
+        if zstandard is None:
+            raise Exception("zstd compression requires the `zstandard` package")
+        if mode == "wb":
+            return zstandard.ZstdCompressor(level=3).stream_writer(open(filename, "wb"))
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"))
+    elif compression == "gzip":
+        return gzip.open(filename, mode, compresslevel=6)
+    elif compression is None:
+        return open(filename, mode, buffering=1 << 20)
+    raise Exception(f"Unknown compression `{compression}`")
+
+
+def _read(file, size):
+    # Decompressing readers may return less than asked for, so a document can span several reads.
+    chunks = []
+    while size > 0:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def iter_documents(file):
+    # Every BSON document starts with its total length as a little-endian int32, so documents are read one at a time.
+    while True:
+        header = _read(file, 4)
+        if not header:
+            return
+        size = int.from_bytes(header, "little") - 4
+        body = _read(file, size)
+        if len(header) < 4 or len(body) < size:
+            raise Exception("Truncated BSON archive")
+        yield RawBSONDocument(header + body)
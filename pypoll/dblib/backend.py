@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+
+
+class Backend(ABC):
+    @abstractmethod
+    def insert_many(self, collection, data, ordered=True):
+        pass
+
+    @abstractmethod
+    def insert_new(self, collection, data):
+        pass
+
+    @abstractmethod
+    def count_documents(self, collection, since=None, until=None):
+        pass
+
+    @abstractmethod
+    def get_created_date(self, collection, order="ASC"):
+        pass
+
+    @abstractmethod
+    def update_metadata(self, username, cursor, next_cursor):
+        pass
+
+    @abstractmethod
+    def get_cursor(self, username):
+        pass
+
+    @abstractmethod
+    def get_all(self, collection, since=None, until=None, projection=None, batch_size=None, raw=False):
+        pass
+
+    @abstractmethod
+    def exist_username(self, collection, username):
+        pass
+
+    @abstractmethod
+    def get_usernames(self, collection):
+        pass
+
+    @abstractmethod
+    def get_tweet(self, collection, tweet_id):
+        pass
+
+    @abstractmethod
+    def get_tweets(self, collection, tweet_ids):
+        pass
+
+    @abstractmethod
+    def delete(self, collection):
+        pass
+
+    def ensure_indexes(self, collection, role=None, wait=False):
+        pass
+
+    def aggregate_nodes(self, collection, edge_type, since=None, until=None, exclude=None):
+        raise Exception(f"{type(self).__name__} does not support aggregated graph builds")
+
+    def aggregate_edges(self, collection, edge_type, since=None, until=None, exclude=None):
+        raise Exception(f"{type(self).__name__} does not support aggregated graph builds")
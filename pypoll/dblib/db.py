@@ -1,19 +1,111 @@
+from pypoll.dblib.backend import Backend
+from pypoll.dblib.indexes import INDEXES, DUPLICATE_KEY_ERROR, collection_role, key_fields
+from pypoll.dblib.archive import EXTENSIONS, archive_collection, archive_compression, open_archive, iter_documents
+from pypoll.metricslib import metrics
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+import threading
+import warnings
+import os
 import pymongo
-import bson
 
 
-class MongoDB:
+class MongoDB(Backend):
     def __init__(self, host, db_name, port=27017, username=None, password=None):
         self.client = pymongo.MongoClient(host, port, username=username, password=password)
         self.db = db_name
-        self.create_index("metadata")
+        self.__index_builds = dict()
+        self.__index_roles = dict()
+        self.__index_lock = threading.Lock()
+        self.ensure_indexes("metadata", wait=True)
 
-    def insert_many(self, collection, data):
-        self.client[self.db][collection].insert_many(data)
+    def __collection(self, collection, role=None):
+        # Every operation goes through here once, so this counts the queries and writes sent to the server.
+        self.ensure_indexes(collection, role)
+        metrics.count("db.round_trips", role=self.__index_roles[collection])
+        return self.client[self.db][collection]
 
-    def count_documents(self, collection):
-        return self.client[self.db][collection].count_documents({})
+    def ensure_indexes(self, collection, role=None, wait=False):
+        # The first use of a collection starts one background build of the indexes of its role; later calls are free.
+        with self.__index_lock:
+            build = self.__index_builds.get(collection)
+            if build is None:
+                self.__index_roles[collection] = collection_role(collection, role)
+                build = threading.Thread(target=self.__build_indexes, args=(collection, self.__index_roles[collection]), daemon=True)
+                self.__index_builds[collection] = build
+                build.start()
+        if wait:
+            build.join()
+
+    def create_index(self, collection):
+        warnings.warn("`create_index` is deprecated, use `ensure_indexes(collection, \"followers\")`", DeprecationWarning, stacklevel=2)
+        created = "username_1" not in self.client[self.db][collection].index_information()
+        self.ensure_indexes(collection, "followers", wait=True)
+        return created
+
+    def create_tweet_index(self, collection):
+        warnings.warn("`create_tweet_index` is deprecated, use `ensure_indexes(collection, \"tweets\")`", DeprecationWarning, stacklevel=2)
+        created = "id_1" not in self.client[self.db][collection].index_information()
+        self.ensure_indexes(collection, "tweets", wait=True)
+        return created
+
+    def wait_for_indexes(self):
+        for build in list(self.__index_builds.values()):
+            build.join()
+
+    def __build_indexes(self, collection, role):
+        existing = {key_fields(index["key"]) for index in self.client[self.db][collection].index_information().values()}
+        for spec in INDEXES[role]:
+            # An index on the same fields is kept as is, e.g. a non-unique `id` index of an older release.
+            if key_fields(spec["keys"]) in existing:
+                continue
+            try:
+                self.client[self.db][collection].create_index(spec["keys"], unique=spec["unique"], background=True)
+            except pymongo.errors.OperationFailure as e:
+                if not spec["unique"] or e.code != DUPLICATE_KEY_ERROR:
+                    print(f"Index build on `{collection}` failed. {e}")
+                    continue
+                print(f"`{collection}` has duplicate {key_fields(spec['keys'])} values, creating a non-unique index ...")
+                self.client[self.db][collection].create_index(spec["keys"], background=True)
+
+    def index_stats(self, collection=None):
+        if collection is None:
+            collections = self.client[self.db].list_collection_names()
+        else:
+            collections = [collection]
+        stats = dict()
+        for name in collections:
+            stats[name] = {
+                index["name"]: {"accesses": index["accesses"]["ops"], "since": index["accesses"]["since"]}
+                for index in self.client[self.db][name].aggregate([{"$indexStats": {}}])
+            }
+        return stats
+
+    def insert_many(self, collection, data, ordered=True):
+        self.__collection(collection).insert_many(data, ordered=ordered)
+        metrics.count("db.documents_written", len(data), role=self.__index_roles[collection])
+
+    def insert_new(self, collection, data):
+        tweet_ids = list({document["id"] for document in data})
+        if not len(tweet_ids):
+            return 0
+        existing = {document["id"] for document in self.__collection(collection).find({"id": {"$in": tweet_ids}}, {"_id": 0, "id": 1})}
+        documents = dict()
+        for document in data:
+            if document["id"] not in existing and document["id"] not in documents:
+                documents[document["id"]] = document
+        inserted = 0
+        if len(documents):
+            # A concurrent writer can insert the same ids between the lookup and the insert, the unique index skips them.
+            inserted = self.__insert_batch(collection, list(documents.values()))
+        metrics.count("db.documents_written", inserted, role=self.__index_roles[collection])
+        metrics.count("db.duplicates_skipped", len(data) - inserted, role=self.__index_roles[collection])
+        return inserted
+
+    def count_documents(self, collection, since=None, until=None):
+        return self.__collection(collection).count_documents(self.__created_at_query(since, until))
 
     def get_created_date(self, collection, order="ASC"):
         if order == "ASC":
@@ -21,13 +113,13 @@ class MongoDB:
         else:
             order_key = -1
         try:
-            res = self.client[self.db][collection].aggregate([{"$sort": {"created_at": order_key}}, {"$limit": 1}]).next()["created_at"]
+            res = self.__collection(collection).aggregate([{"$sort": {"created_at": order_key}}, {"$limit": 1}]).next()["created_at"]
         except:
             res = None
         return res
 
     def update_metadata(self, username, cursor, next_cursor):
-        self.client[self.db]["metadata"].update_one(
+        self.__collection("metadata").update_one(
             {"username": username},
             {"$set": {
                 "next_cursor": next_cursor,
@@ -37,54 +129,182 @@ class MongoDB:
         )
 
     def get_cursor(self, username):
-        res = self.client[self.db]["metadata"].find_one({"username": username})
+        res = self.__collection("metadata").find_one({"username": username})
         return res
 
-    def create_index(self, collection):
-        indexes = self.client[self.db][collection].index_information()
-        if "username_1" in indexes:
-            return False
-        self.client[self.db][collection].create_index([("username", pymongo.ASCENDING)], unique=True)
-        return True
+    @staticmethod
+    def __created_at_query(since=None, until=None):
+        # Both bounds are inclusive, `Graph.update_graph` skips the tweets it already has at its high-water mark.
+        query = dict()
+        if since is not None:
+            query["$gte"] = since
+        if until is not None:
+            query["$lte"] = until
+        if len(query):
+            return {"created_at": query}
+        return {}
 
-    def get_all(self, collection):
-        return self.client[self.db][collection].find({}).sort([("created_at", -1)]).allow_disk_use(True)
+    def __match(self, since=None, until=None, exclude=None):
+        query = self.__created_at_query(since, until)
+        if exclude:
+            query["id"] = {"$nin": list(exclude)}
+        return query
+
+    def get_all(self, collection, since=None, until=None, projection=None, batch_size=None, raw=False):
+        documents = self.__collection(collection)
+        if raw:
+            # Raw documents are decoded lazily, field by field, when they are first read.
+            documents = documents.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+        cursor = documents.find(self.__created_at_query(since, until), projection).sort([("created_at", -1)]).allow_disk_use(True)
+        if batch_size is not None:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    @staticmethod
+    def __reference_type(edge_type):
+        if edge_type == "retweet":
+            return "retweeted"
+        elif edge_type == "quote":
+            return "quoted"
+        raise Exception(f"Unknown edge type `{edge_type}`")
+
+    def __reference_stages(self, collection, edge_type):
+        return [
+            {"$project": {
+                "_id": 0, "created_at": 1, "author.username": 1, "author.public_metrics": 1,
+                "references": {"$filter": {
+                    "input": {"$ifNull": ["$referenced_tweets", []]},
+                    "as": "reference",
+                    "cond": {"$eq": ["$$reference.type", self.__reference_type(edge_type)]}
+                }}
+            }},
+            {"$unwind": {"path": "$references", "includeArrayIndex": "position", "preserveNullAndEmptyArrays": True}},
+            {"$lookup": {
+                "from": collection,
+                "localField": "references.id",
+                "foreignField": "id",
+                "pipeline": [{"$limit": 1}, {"$project": {"_id": 0, "created_at": 1, "author.username": 1, "author.public_metrics": 1}}],
+                "as": "referenced"
+            }}
+        ]
+
+    def aggregate_nodes(self, collection, edge_type, since=None, until=None, exclude=None):
+        if edge_type == "mention":
+            pipeline = [
+                {"$project": {"_id": 0, "created_at": 1, "users": {"$concatArrays": [
+                    [{"username": "$author.username", "public_metrics": "$author.public_metrics"}],
+                    {"$map": {"input": {"$ifNull": ["$entities.mentions", []]}, "as": "mention", "in": {"username": "$$mention.username"}}}
+                ]}}},
+                {"$unwind": {"path": "$users", "includeArrayIndex": "position"}}
+            ]
+        else:
+            pipeline = self.__reference_stages(collection, edge_type) + [
+                {"$project": {"created_at": 1, "position": 1, "users": {"$concatArrays": [
+                    {"$cond": [
+                        {"$gt": [{"$ifNull": ["$position", 0]}, 0]},
+                        [],
+                        [{"username": "$author.username", "public_metrics": "$author.public_metrics"}]
+                    ]},
+                    {"$map": {"input": "$referenced", "as": "tweet", "in": {"username": "$$tweet.author.username", "public_metrics": "$$tweet.author.public_metrics"}}}
+                ]}}},
+                {"$unwind": {"path": "$users", "includeArrayIndex": "occurrence"}},
+                {"$addFields": {"position": {"$add": [{"$multiply": [{"$ifNull": ["$position", 0]}, 2]}, "$occurrence"]}}}
+            ]
+        # The graph keeps the attributes of the last occurrence in `get_all` order (newest first), i.e. the oldest one.
+        pipeline += [
+            {"$sort": {"created_at": -1, "position": 1}},
+            {"$group": {"_id": "$users.username", "public_metrics": {"$last": "$users.public_metrics"}}}
+        ]
+        pipeline.insert(0, {"$match": self.__match(since, until, exclude)})
+        return self.__collection(collection).aggregate(pipeline, allowDiskUse=True)
+
+    def aggregate_edges(self, collection, edge_type, since=None, until=None, exclude=None):
+        if edge_type == "mention":
+            pipeline = [
+                {"$project": {"_id": 0, "created_at": 1, "source": "$author.username", "target": "$entities.mentions.username"}},
+                {"$unwind": "$target"}
+            ]
+        else:
+            pipeline = self.__reference_stages(collection, edge_type) + [
+                {"$unwind": "$referenced"},
+                {"$project": {"created_at": 1, "source": "$author.username", "target": "$referenced.author.username", "referenced_at": "$referenced.created_at"}}
+            ]
+        # An edge keeps the `created_at` of the first occurrence in `get_all` order, i.e. the newest one.
+        pipeline += [
+            {"$sort": {"created_at": -1}},
+            {"$group": {
+                "_id": {"source": "$source", "target": "$target"},
+                "weight": {"$sum": 1},
+                "created_at": {"$first": "$created_at" if edge_type == "mention" else "$referenced_at"}
+            }}
+        ]
+        pipeline.insert(0, {"$match": self.__match(since, until, exclude)})
+        return self.__collection(collection).aggregate(pipeline, allowDiskUse=True)
 
     def exist_username(self, collection, username):
-        if self.client[self.db][collection].find_one({"username": username}):
+        if self.__collection(collection, "followers").find_one({"username": username}):
             return True
         return False
 
+    def get_usernames(self, collection):
+        return self.__collection(collection, "followers").find({}, {"_id": 0, "username": 1})
+
     def get_tweet(self, collection, tweet_id):
-        tweet = self.client[self.db][collection].find_one({"id": tweet_id})
+        tweet = self.__collection(collection).find_one({"id": tweet_id})
         return tweet
 
-    def dump(self, collection):
+    def get_tweets(self, collection, tweet_ids):
+        return self.__collection(collection).find({"id": {"$in": tweet_ids}}, {"_id": 0, "id": 1, "author": 1, "created_at": 1})
+
+    def dump(self, collection, compression=None, batch_size=1000):
         count = self.count_documents(collection)
-        print(f"Exporting collection `{collection}` with {count} ...")
-        file = open(f"{collection}.bson", "wb+")
-        cursor = self.get_all(collection)
-        for doc in tqdm(cursor, total=count):
-            file.write(bson.BSON.encode(doc))
-
-    def restore(self, filename):
-        if "/" in filename:
-            collection = filename.split("/")[-1].replace(".bson", "")
-        else:
-            collection = filename.replace(".bson", "")
+        filename = f"{collection}{EXTENSIONS[compression]}"
+        print(f"Exporting collection `{collection}` with {count} to `{filename}` ...")
+        # Raw documents are written as they come from the server, without decoding and re-encoding them.
+        cursor = self.__collection(collection).with_options(codec_options=CodecOptions(document_class=RawBSONDocument)).find(batch_size=batch_size)
+        with open_archive(filename, "wb", compression) as file:
+            for doc in tqdm(cursor, total=count):
+                file.write(doc.raw)
+        metrics.count("db.bytes_written", os.path.getsize(filename), compression=str(compression))
+        return filename
+
+    def restore(self, filename, batch_size=1000):
+        collection = archive_collection(filename)
         print(f"Importing collection `{collection}` ...")
-        file = open(filename, "rb+")
+        inserted = 0
         docs = []
-        for doc in tqdm(bson.decode_iter(file.read())):
-            docs.append(doc)
-            if len(doc) > 10000:
-                self.client[self.db][collection].insert_many(docs)
-                docs.clear()
+        with open_archive(filename, "rb", archive_compression(filename)) as file:
+            for doc in tqdm(iter_documents(file), desc=collection):
+                docs.append(doc)
+                if len(docs) >= batch_size:
+                    inserted += self.__insert_batch(collection, docs)
+                    docs = []
         if len(docs):
-            self.client[self.db][collection].insert_many(docs)
+            inserted += self.__insert_batch(collection, docs)
+        return inserted
+
+    def __insert_batch(self, collection, docs):
+        # Unordered, so that documents already in the collection are skipped and the rest of the batch is still written.
+        try:
+            return len(self.__collection(collection).insert_many(docs, ordered=False).inserted_ids)
+        except pymongo.errors.BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+                raise
+            return e.details["nInserted"]
+
+    def restore_many(self, filenames, workers=4, batch_size=1000):
+        with ThreadPoolExecutor(workers) as executor:
+            counts = executor.map(lambda filename: self.restore(filename, batch_size), filenames)
+        return dict(zip([archive_collection(filename) for filename in filenames], counts))
+
     def delete(self, collection):
         print(f"Deleting `{collection}` collection ...")
         self.client[self.db][collection].drop()
+        with self.__index_lock:
+            build = self.__index_builds.pop(collection, None)
+            self.__index_roles.pop(collection, None)
+        if build is not None:
+            build.join()
 
     def update(self, collection, find_rule, update_rule):
-        self.client[self.db][collection].update_many(find_rule, update_rule)
+        self.__collection(collection).update_many(find_rule, update_rule)
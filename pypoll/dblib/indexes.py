@@ -0,0 +1,34 @@
+import pymongo
+
+
+# Indexes that each collection role needs. Hashtag collections are looked up by tweet `id` (references, duplicate
+# detection) and read or sorted by `created_at`; follower collections and `metadata` are keyed by `username`.
+INDEXES = {
+    "tweets": [
+        {"keys": [("id", pymongo.ASCENDING)], "unique": True},
+        {"keys": [("created_at", pymongo.DESCENDING)], "unique": False}
+    ],
+    "followers": [
+        {"keys": [("username", pymongo.ASCENDING)], "unique": True}
+    ],
+    "metadata": [
+        {"keys": [("username", pymongo.ASCENDING)], "unique": True}
+    ],
+    "other": []
+}
+DUPLICATE_KEY_ERROR = 11000
+
+
+def collection_role(collection, role=None):
+    # Follower collections are named after the account, so only callers that know them can say so.
+    if role is not None:
+        return role
+    elif collection == "metadata":
+        return "metadata"
+    elif collection.startswith("#"):
+        return "tweets"
+    return "other"
+
+
+def key_fields(keys):
+    return tuple(field for field, _ in keys)
@@ -0,0 +1,347 @@
+from pypoll.dblib.backend import Backend
+from pypoll.dblib.indexes import collection_role
+from bson.raw_bson import RawBSONDocument
+from datetime import datetime, timezone
+from uuid import uuid4
+import numpy as np
+import threading
+import shutil
+import json
+import bson
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+METRICS = ("followers_count", "following_count", "tweet_count", "listed_count")
+REFERENCES = {"retweet": "retweeted", "quote": "quoted"}
+
+
+def _schema(role):
+    fields = [("id", pa.string()), ("created_at", pa.timestamp("ms")), ("username", pa.string())]
+    if role == "tweets":
+        fields += [(metric, pa.int64()) for metric in METRICS]
+        fields += [(column, pa.list_(pa.string())) for column in ("mentions", "retweeted", "quoted")]
+    fields.append(("document", pa.binary()))
+    return pa.schema(fields)
+
+
+def _utc(created_at):
+    # Dates are kept as naive UTC, the way pymongo returns them.
+    if not isinstance(created_at, datetime):
+        return None
+    if created_at.tzinfo is not None:
+        return created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+
+def _row(document, role):
+    row = {
+        "id": str(document["id"]) if document.get("id") is not None else None,
+        "created_at": _utc(document.get("created_at")),
+        "document": bson.encode(document)
+    }
+    if role != "tweets":
+        row["username"] = document.get("username")
+        return row
+    author = document.get("author") or {}
+    row["username"] = author.get("username")
+    metrics = author.get("public_metrics")
+    for metric in METRICS:
+        row[metric] = metrics.get(metric, 0) if metrics is not None else None
+    row["mentions"] = [mention.get("username") for mention in (document.get("entities") or {}).get("mentions", [])]
+    references = document.get("referenced_tweets") or []
+    for column in ("retweeted", "quoted"):
+        row[column] = [str(reference["id"]) for reference in references if reference["type"] == column]
+    return row
+
+
+def _partition(row, role):
+    if role != "tweets":
+        return ""
+    if row["created_at"] is None:
+        return "date=none"
+    return row["created_at"].strftime("date=%Y-%m-%d")
+
+
+def _projection_tree(projection):
+    if projection is None:
+        return None
+    tree = dict()
+    for path, included in projection.items():
+        if path == "_id" or not included:
+            continue
+        node = tree
+        fields = path.split(".")
+        for field in fields[:-1]:
+            node = node.setdefault(field, dict())
+            if node is True:
+                break
+        else:
+            node[fields[-1]] = True
+    return tree
+
+
+def _project(value, tree):
+    # Inclusion projections with dotted paths, applied through arrays of embedded documents as MongoDB does.
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value if isinstance(item, dict)]
+    result = dict()
+    for field, subtree in tree.items():
+        if field not in value:
+            continue
+        if subtree is True:
+            result[field] = value[field]
+        elif isinstance(value[field], (dict, list)):
+            result[field] = _project(value[field], subtree)
+    return result
+
+
+def _array(values):
+    if isinstance(values, pa.ChunkedArray):
+        return values.combine_chunks()
+    return values
+
+
+def _codes(values):
+    encoded = pc.dictionary_encode(values)
+    return encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64), encoded.dictionary
+
+
+class ParquetStore(Backend):
+    def __init__(self, path):
+        if pa is None:
+            raise Exception("ParquetStore requires the `pyarrow` package")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__metadata_file = os.path.join(path, "metadata.json")
+        self.__metadata = dict()
+        if os.path.exists(self.__metadata_file):
+            metadata_file = open(self.__metadata_file, "r", encoding="utf8")
+            self.__metadata = json.load(metadata_file)
+            metadata_file.close()
+
+    def __directory(self, collection):
+        return os.path.join(self.path, collection)
+
+    def __partitions(self, collection, since=None, until=None, dates=None):
+        # Tweets live in one directory per day, newest first, so date bounds skip whole partitions.
+        directory = self.__directory(collection)
+        if not os.path.isdir(directory):
+            return []
+        if collection_role(collection) != "tweets":
+            return [directory]
+        since, until = _utc(since), _utc(until)
+        names = sorted((name for name in os.listdir(directory) if name.startswith("date=") and name != "date=none"), reverse=True)
+        if since is not None:
+            names = [name for name in names if name[5:] >= since.strftime("%Y-%m-%d")]
+        if until is not None:
+            names = [name for name in names if name[5:] <= until.strftime("%Y-%m-%d")]
+        if since is None and until is None and os.path.isdir(os.path.join(directory, "date=none")):
+            names.append("date=none")
+        if dates is not None:
+            names = [name for name in names if name in dates]
+        return [os.path.join(directory, name) for name in names]
+
+    @staticmethod
+    def __created_at_filter(since=None, until=None):
+        expression = None
+        if since is not None:
+            expression = pc.field("created_at") >= pa.scalar(_utc(since), pa.timestamp("ms"))
+        if until is not None:
+            bound = pc.field("created_at") <= pa.scalar(_utc(until), pa.timestamp("ms"))
+            expression = bound if expression is None else expression & bound
+        return expression
+
+    def __tables(self, collection, columns, since=None, until=None, expression=None, dates=None):
+        schema = _schema(collection_role(collection))
+        created_at = self.__created_at_filter(since, until)
+        if created_at is not None:
+            expression = created_at if expression is None else expression & created_at
+        for directory in self.__partitions(collection, since, until, dates):
+            yield ds.dataset(directory, schema=schema, format="parquet").to_table(columns=columns, filter=expression)
+
+    def __table(self, collection, columns, since=None, until=None, expression=None, dates=None):
+        tables = list(self.__tables(collection, columns, since, until, expression, dates))
+        if not len(tables):
+            return _schema(collection_role(collection)).empty_table().select(columns)
+        return pa.concat_tables(tables).combine_chunks()
+
+    def insert_many(self, collection, data, ordered=True):
+        role = collection_role(collection)
+        partitions = dict()
+        for document in data:
+            row = _row(document, role)
+            partitions.setdefault(_partition(row, role), []).append(row)
+        for partition, rows in partitions.items():
+            directory = os.path.join(self.__directory(collection), partition)
+            os.makedirs(directory, exist_ok=True)
+            # Written under a hidden name first, which readers skip, and renamed once complete.
+            name = f"part-{uuid4().hex}.parquet"
+            pq.write_table(pa.Table.from_pylist(rows, schema=_schema(role)), os.path.join(directory, f".{name}"))
+            os.replace(os.path.join(directory, f".{name}"), os.path.join(directory, name))
+
+    def insert_new(self, collection, data):
+        role = collection_role(collection)
+        tweet_ids = list({str(document["id"]) for document in data})
+        if not len(tweet_ids):
+            return 0
+        with self.__lock:
+            # A tweet can only be stored in the partition of its own date.
+            dates = {_partition({"created_at": _utc(document.get("created_at"))}, role) for document in data} if role == "tweets" else None
+            existing = set(self.__table(collection, ["id"], expression=pc.field("id").isin(tweet_ids), dates=dates).column("id").to_pylist())
+            documents = dict()
+            for document in data:
+                if str(document["id"]) not in existing and str(document["id"]) not in documents:
+                    documents[str(document["id"])] = document
+            if len(documents):
+                self.insert_many(collection, list(documents.values()), ordered=False)
+        return len(documents)
+
+    def count_documents(self, collection, since=None, until=None):
+        schema = _schema(collection_role(collection))
+        return sum(
+            ds.dataset(directory, schema=schema, format="parquet").count_rows(filter=self.__created_at_filter(since, until))
+            for directory in self.__partitions(collection, since, until)
+        )
+
+    def get_created_date(self, collection, order="ASC"):
+        partitions = [partition for partition in self.__partitions(collection) if not partition.endswith("date=none")]
+        if order == "ASC":
+            partitions.reverse()
+        schema = _schema(collection_role(collection))
+        for directory in partitions:
+            bounds = pc.min_max(ds.dataset(directory, schema=schema, format="parquet").to_table(columns=["created_at"]).column("created_at"))
+            res = bounds["min" if order == "ASC" else "max"].as_py()
+            if res is not None:
+                return res
+        return None
+
+    def update_metadata(self, username, cursor, next_cursor):
+        with self.__lock:
+            self.__metadata[username] = {"username": username, "next_cursor": next_cursor, "cursor": cursor}
+            metadata_file = open(f"{self.__metadata_file}.tmp", "w", encoding="utf8")
+            json.dump(self.__metadata, metadata_file, ensure_ascii=False)
+            metadata_file.close()
+            os.replace(f"{self.__metadata_file}.tmp", self.__metadata_file)
+
+    def get_cursor(self, username):
+        res = self.__metadata.get(username)
+        if res is None:
+            return None
+        return dict(res)
+
+    def get_all(self, collection, since=None, until=None, projection=None, batch_size=None, raw=False):
+        tree = _projection_tree(projection)
+        for table in self.__tables(collection, ["created_at", "document"], since, until):
+            table = table.take(pc.sort_indices(table, sort_keys=[("created_at", "descending")]))
+            for batch in table.to_batches(max_chunksize=batch_size or 1000):
+                for blob in batch.column(1).to_pylist():
+                    if raw:
+                        yield RawBSONDocument(blob)
+                    elif tree is None:
+                        yield bson.decode(blob)
+                    else:
+                        yield _project(bson.decode(blob), tree)
+
+    def exist_username(self, collection, username):
+        return self.__table(collection, ["username"], expression=pc.field("username") == username).num_rows > 0
+
+    def get_usernames(self, collection):
+        for table in self.__tables(collection, ["username"]):
+            for username in table.column("username").to_pylist():
+                yield {"username": username}
+
+    def get_tweet(self, collection, tweet_id):
+        table = self.__table(collection, ["document"], expression=pc.field("id") == str(tweet_id))
+        if table.num_rows == 0:
+            return None
+        return bson.decode(table.column("document")[0].as_py())
+
+    def get_tweets(self, collection, tweet_ids):
+        tree = _projection_tree({"id": 1, "author": 1, "created_at": 1})
+        table = self.__table(collection, ["document"], expression=pc.field("id").isin([str(tweet_id) for tweet_id in tweet_ids]))
+        for blob in table.column("document").to_pylist():
+            yield _project(bson.decode(blob), tree)
+
+    def delete(self, collection):
+        print(f"Deleting `{collection}` collection ...")
+        if os.path.isdir(self.__directory(collection)):
+            shutil.rmtree(self.__directory(collection))
+
+    def __occurrences(self, collection, edge_type, since=None, until=None, exclude=None):
+        # Every appearance of a user in `get_all` order: the author of each tweet, then the users it mentions or references.
+        column = "mentions" if edge_type == "mention" else REFERENCES.get(edge_type)
+        if column is None:
+            raise Exception(f"Unknown edge type `{edge_type}`")
+        expression = ~pc.field("id").isin(pa.array(list(exclude), pa.string())) if exclude else None
+        table = self.__table(collection, ["created_at", "username", *METRICS, column], since, until, expression)
+        table = table.take(pc.sort_indices(table, sort_keys=[("created_at", "descending")]))
+        parents = pc.list_parent_indices(table.column(column)).to_numpy()
+        values = pc.list_flatten(table.column(column))
+        if edge_type == "mention":
+            usernames = values
+            metrics = [pa.nulls(len(values), pa.int64()) for _ in METRICS]
+            created_at = table.column("created_at").take(pa.array(parents, pa.int64()))
+        else:
+            # Referenced tweets are looked up in the whole collection, like the `$lookup` stage of `MongoDB`.
+            lookup = self.__table(collection, ["id", "created_at", "username", *METRICS])
+            position = pc.index_in(values, value_set=lookup.column("id"))
+            found = pc.is_valid(position).to_numpy(zero_copy_only=False)
+            parents = parents[found]
+            position = position.filter(pa.array(found))
+            usernames = lookup.column("username").take(position)
+            metrics = [lookup.column(metric).take(position) for metric in METRICS]
+            created_at = lookup.column("created_at").take(position)
+        n, m = table.num_rows, len(parents)
+        order = pa.array(np.lexsort((
+            np.concatenate([np.zeros(n, dtype=np.int64), np.arange(1, m + 1)]), np.concatenate([np.arange(n), parents])
+        )))
+        occurrences = {
+            "username": pa.concat_arrays([_array(table.column("username")), _array(usernames)]).take(order),
+            "metrics": [pa.concat_arrays([_array(table.column(metric)), _array(values)]).take(order) for metric, values in zip(METRICS, metrics)]
+        }
+        edges = {
+            "source": _array(table.column("username").take(pa.array(parents, pa.int64()))),
+            "target": _array(usernames),
+            "created_at": _array(created_at)
+        }
+        return occurrences, edges
+
+    def aggregate_nodes(self, collection, edge_type, since=None, until=None, exclude=None):
+        occurrences, _ = self.__occurrences(collection, edge_type, since, until, exclude)
+        codes, dictionary = _codes(occurrences["username"])
+        # A user keeps the attributes of its last appearance, i.e. the oldest one.
+        reverse = codes[::-1]
+        unique, first = np.unique(reverse, return_index=True)
+        last = len(codes) - 1 - first[unique >= 0]
+        indices = pa.array(last, pa.int64())
+        metrics = [values.take(indices).to_pylist() for values in occurrences["metrics"]]
+        for index, username in enumerate(occurrences["username"].take(indices).to_pylist()):
+            if metrics[0][index] is None:
+                yield {"_id": username, "public_metrics": None}
+            else:
+                yield {"_id": username, "public_metrics": {metric: values[index] for metric, values in zip(METRICS, metrics)}}
+
+    def aggregate_edges(self, collection, edge_type, since=None, until=None, exclude=None):
+        _, edges = self.__occurrences(collection, edge_type, since, until, exclude)
+        source, target = edges["source"], edges["target"]
+        codes, dictionary = _codes(pa.concat_arrays([source, target]))
+        source_codes, target_codes = codes[:len(source)], codes[len(source):]
+        valid = (source_codes >= 0) & (target_codes >= 0)
+        keys = source_codes * max(len(dictionary), 1) + target_codes
+        # An edge keeps the `created_at` of its first appearance, i.e. the newest one.
+        unique, first, inverse = np.unique(keys[valid], return_index=True, return_inverse=True)
+        rows = np.flatnonzero(valid)[first]
+        weights = np.bincount(inverse.ravel(), minlength=len(unique)).tolist()
+        indices = pa.array(rows, pa.int64())
+        created_at = edges["created_at"].take(indices).to_pylist()
+        for index, (u, v) in enumerate(zip(source.take(indices).to_pylist(), target.take(indices).to_pylist())):
+            yield {"_id": {"source": u, "target": v}, "weight": weights[index], "created_at": created_at[index]}
@@ -1 +1,5 @@
-from .graph import Graph
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["Graph"]
+__getattr__, __dir__ = lazy_module(__name__, {"Graph": ".graph"})
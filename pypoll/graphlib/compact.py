@@ -0,0 +1,301 @@
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.csgraph import connected_components
+from datetime import datetime, timezone
+from array import array
+import json
+import os
+import networkx as nx
+import numpy as np
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+METRICS = ("followers", "following", "tweet", "listed")
+
+
+def to_timestamp(created_at):
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return int(created_at.timestamp())
+
+
+def from_timestamp(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime(DATE_FORMAT)
+
+
+def encode_strings(strings):
+    encoded = [string.encode("utf8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data, offsets):
+    data = bytes(data)
+    return [data[offsets[index]:offsets[index + 1]].decode("utf8") for index in range(len(offsets) - 1)]
+
+
+class StringTable:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode("utf8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class CompactGraph:
+    def __init__(self, usernames, metrics, follows, source, target, weight, created_at, users=None, indptr=None):
+        self.usernames = usernames
+        self.metrics = metrics
+        self.follows = follows
+        self.source = source
+        self.target = target
+        self.weight = weight
+        self.created_at = created_at
+        self.users = users
+        self.__indptr = indptr
+        self.__index = None
+
+    @property
+    def index(self):
+        if self.__index is None:
+            self.__index = {username: index for index, username in enumerate(self.usernames)}
+        return self.__index
+
+    def number_of_nodes(self):
+        return len(self.usernames)
+
+    def number_of_edges(self):
+        return len(self.source)
+
+    def labels(self):
+        masks, inverse = np.unique(self.follows, return_inverse=True)
+        labels = np.empty(len(masks), dtype=object)
+        for position, mask in enumerate(masks):
+            follows = [user for index, user in enumerate(self.users) if int(mask) >> index & 1]
+            labels[position] = ",".join(follows) if len(follows) else "none"
+        return labels[inverse.ravel()]
+
+    def degree(self):
+        n = self.number_of_nodes()
+        return np.bincount(self.source, minlength=n) + np.bincount(self.target, minlength=n)
+
+    @property
+    def indptr(self):
+        # Edges are kept sorted by (source, target), so `target` already is the CSR column index array.
+        if self.__indptr is None:
+            self.__indptr = np.zeros(self.number_of_nodes() + 1, dtype=self.target.dtype)
+            np.cumsum(np.bincount(self.source, minlength=self.number_of_nodes()), out=self.__indptr[1:])
+        return self.__indptr
+
+    def adjacency(self, weighted=False):
+        n = self.number_of_nodes()
+        data = self.weight if weighted else np.ones(len(self.source), dtype=np.int8)
+        return csr_matrix((data, self.target, self.indptr), shape=(n, n))
+
+    def laplacian(self):
+        n = self.number_of_nodes()
+        loops = self.source == self.target
+        source, target, weight = self.source[~loops], self.target[~loops], self.weight[~loops]
+        # Like `DiGraph.to_undirected`, a reciprocated pair keeps the weight of the edge whose source was added last.
+        low, high = np.minimum(source, target).astype(np.int64), np.maximum(source, target).astype(np.int64)
+        order = np.lexsort((source, high, low))
+        keys = low[order] * n + high[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        low, high, weight = low[order][last], high[order][last], weight[order][last].astype(float)
+        adjacency = csr_matrix((np.concatenate([weight, weight]), (np.concatenate([low, high]), np.concatenate([high, low]))), shape=(n, n))
+        return (diags(np.asarray(adjacency.sum(axis=1)).ravel()) - adjacency).tocsr()
+
+    def subgraph(self, keep, edges=None):
+        mapping = np.full(self.number_of_nodes(), -1, dtype=np.int64)
+        mapping[keep] = np.arange(np.count_nonzero(keep))
+        if edges is None:
+            edges = keep[self.source] & keep[self.target]
+        return CompactGraph(
+            [username for username, kept in zip(self.usernames, keep) if kept],
+            self.metrics[keep], self.follows[keep],
+            mapping[self.source[edges]].astype(np.int32), mapping[self.target[edges]].astype(np.int32),
+            self.weight[edges], self.created_at[edges], self.users
+        )
+
+    def pruned_nodes(self, giant_component=False, remove_leaf_nodes=False):
+        graph = self
+        nodes = np.arange(self.number_of_nodes())
+        if giant_component:
+            keep = graph.degree() > 0
+            graph, nodes = graph.subgraph(keep), nodes[keep]
+            count, labels = connected_components(graph.adjacency(), directed=True, connection="weak")
+            keep = labels == np.argmax(np.bincount(labels))
+            graph, nodes = graph.subgraph(keep), nodes[keep]
+        if remove_leaf_nodes:
+            nodes = nodes[graph.degree() != 1]
+        keep = np.zeros(self.number_of_nodes(), dtype=bool)
+        keep[nodes] = True
+        return keep
+
+    def prune(self, giant_component=False, remove_leaf_nodes=False):
+        return self.subgraph(self.pruned_nodes(giant_component, remove_leaf_nodes))
+
+    def removed(self, keep):
+        # The nodes outside `keep` and every edge that touches one of them, i.e. what `subgraph(keep)` leaves out.
+        edges = ~(keep[self.source] & keep[self.target])
+        nodes = ~keep
+        nodes[self.source[edges]] = True
+        nodes[self.target[edges]] = True
+        return self.subgraph(nodes, edges)
+
+    def merge(self, other):
+        index = self.index
+        usernames = list(self.usernames)
+        mapping = np.empty(other.number_of_nodes(), dtype=np.int64)
+        new_nodes = []
+        for position, username in enumerate(other.usernames):
+            if username not in index:
+                index[username] = len(usernames)
+                usernames.append(username)
+                new_nodes.append(position)
+            mapping[position] = index[username]
+        self.usernames = usernames
+        self.metrics = np.concatenate([self.metrics, other.metrics[new_nodes]])
+        self.follows = np.concatenate([self.follows, other.follows[new_nodes]])
+        # Edges seen again keep the newer `created_at`, which belongs to the merged graph.
+        source = np.concatenate([self.source, mapping[other.source]]).astype(np.int32)
+        target = np.concatenate([self.target, mapping[other.target]]).astype(np.int32)
+        weight = np.concatenate([self.weight, other.weight])
+        created_at = np.concatenate([self.created_at, other.created_at])
+        self.source, self.target, self.weight, self.created_at = aggregate_edges(source[::-1], target[::-1], weight[::-1], created_at[::-1])
+        self.__indptr = None
+        self.__index = None
+
+    def to_networkx(self):
+        graph = nx.DiGraph()
+        labels = self.labels() if self.users is not None else None
+        for index, (username, metrics) in enumerate(zip(self.usernames, self.metrics.tolist())):
+            if labels is None:
+                graph.add_node(username, **dict(zip(METRICS, metrics)))
+            else:
+                graph.add_node(username, follows=labels[index], **dict(zip(METRICS, metrics)))
+        for source, target, weight, created_at in zip(self.source.tolist(), self.target.tolist(), self.weight.tolist(), self.created_at.tolist()):
+            graph.add_edge(self.usernames[source], self.usernames[target], weight=weight, created_at=from_timestamp(created_at))
+        return graph
+
+    @staticmethod
+    def from_networkx(graph, users=None):
+        builder = CompactGraphBuilder(users)
+        for node, attributes in graph.nodes(data=True):
+            mask = 0
+            if users is not None:
+                follows = attributes.get("follows", "none").split(",")
+                mask = sum(1 << index for index, user in enumerate(users) if user in follows)
+            builder.add_node(node, *[int(attributes.get(metric, 0)) for metric in METRICS], mask)
+        for source, target, attributes in graph.edges(data=True):
+            builder.add_edge(source, target, datetime.strptime(attributes["created_at"], DATE_FORMAT), int(attributes.get("weight", 1)))
+        return builder.build()
+
+    def save_directory(self, path):
+        os.makedirs(path, exist_ok=True)
+        data, offsets = encode_strings(self.usernames)
+        arrays = {
+            "usernames": data, "usernames_offsets": offsets, "metrics": self.metrics, "follows": self.follows,
+            "source": self.source, "target": self.target, "weight": self.weight, "created_at": self.created_at,
+            "indptr": self.indptr
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), values)
+        with open(os.path.join(path, "users.json"), "w", encoding="utf8") as users_file:
+            json.dump(self.users, users_file, ensure_ascii=False)
+
+    @staticmethod
+    def load_directory(path, mmap=True):
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in ("usernames", "usernames_offsets", "metrics", "follows", "source", "target", "weight", "created_at", "indptr")
+        }
+        with open(os.path.join(path, "users.json"), "r", encoding="utf8") as users_file:
+            users = json.load(users_file)
+        return CompactGraph(
+            StringTable(arrays["usernames"], arrays["usernames_offsets"]), arrays["metrics"], arrays["follows"],
+            arrays["source"], arrays["target"], arrays["weight"], arrays["created_at"], users, arrays["indptr"]
+        )
+
+    def save(self, filename):
+        data, offsets = encode_strings(self.usernames)
+        users_data, users_offsets = encode_strings(self.users if self.users is not None else [])
+        np.savez(
+            filename, usernames=data, usernames_offsets=offsets, metrics=self.metrics, follows=self.follows,
+            source=self.source, target=self.target, weight=self.weight, created_at=self.created_at,
+            users=users_data, users_offsets=users_offsets, has_users=self.users is not None
+        )
+
+    @staticmethod
+    def load(filename):
+        # Reading a member of the archive copies it into memory, so the file can be closed right away.
+        with np.load(filename) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        return CompactGraph(
+            decode_strings(arrays["usernames"], arrays["usernames_offsets"]), arrays["metrics"], arrays["follows"],
+            arrays["source"], arrays["target"], arrays["weight"], arrays["created_at"],
+            decode_strings(arrays["users"], arrays["users_offsets"]) if arrays["has_users"] else None
+        )
+
+
+def aggregate_edges(source, target, weight, created_at):
+    keys = source.astype(np.int64) << 32 | target.astype(np.int64)
+    keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return (
+        (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32),
+        np.bincount(inverse.ravel(), weights=weight, minlength=len(keys)).astype(np.int32), created_at[first]
+    )
+
+
+class CompactGraphBuilder:
+    def __init__(self, users=None):
+        if users is not None and len(users) > 63:
+            raise Exception("Compact graphs support up to 63 users")
+        self.users = users
+        self.index = dict()
+        self.usernames = []
+        self.metrics = array("q")
+        self.follows = array("q")
+        self.source = array("i")
+        self.target = array("i")
+        self.weight = array("i")
+        self.created_at = array("q")
+
+    def __intern(self, username):
+        index = self.index.get(username)
+        if index is None:
+            index = self.index[username] = len(self.usernames)
+            self.usernames.append(username)
+            self.metrics.extend((0, 0, 0, 0))
+            self.follows.append(0)
+        return index
+
+    def add_node(self, username, followers, following, tweet, listed, follows=0):
+        index = self.__intern(username)
+        self.metrics[4 * index:4 * index + 4] = array("q", (followers, following, tweet, listed))
+        self.follows[index] = follows
+
+    def add_edge(self, u_of_edge, v_of_edge, created_at, weight=1):
+        self.source.append(self.__intern(u_of_edge))
+        self.target.append(self.__intern(v_of_edge))
+        self.weight.append(weight)
+        self.created_at.append(to_timestamp(created_at))
+
+    def build(self):
+        # The first occurrence of an edge sets its `created_at`, as in `Graph.__add_edge`.
+        source, target, weight, created_at = aggregate_edges(
+            np.frombuffer(self.source, dtype=np.int32), np.frombuffer(self.target, dtype=np.int32),
+            np.frombuffer(self.weight, dtype=np.int32), np.frombuffer(self.created_at, dtype=np.int64)
+        )
+        return CompactGraph(
+            self.usernames, np.frombuffer(self.metrics, dtype=np.int64).reshape(-1, 4).copy(),
+            np.frombuffer(self.follows, dtype=np.int64).copy(), source, target, weight, created_at, self.users
+        )
@@ -0,0 +1,94 @@
+from xml.sax.saxutils import quoteattr
+from datetime import date
+import gzip
+
+
+NAMESPACES = {
+    "1.2draft": "http://www.gexf.net/1.2draft",
+    "1.3": "http://gexf.net/1.3"
+}
+VIZ_NAMESPACE = "http://gexf.net/1.3/viz"
+BUFFER_SIZE = 10000
+ENTITIES = {"\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def gexf_type(value):
+    if type(value) == bool:
+        return "boolean"
+    elif type(value) == int:
+        return "long"
+    elif type(value) == float:
+        return "double"
+    return "string"
+
+
+def _format(value):
+    if type(value) == bool:
+        return "true" if value else "false"
+    return str(value)
+
+
+def _attvalues(values, offset=0):
+    attvalues = [f'<attvalue for="{index + offset}" value={quoteattr(_format(value), ENTITIES)} />' for index, value in enumerate(values) if value is not None]
+    if len(attvalues):
+        return f"<attvalues>{''.join(attvalues)}</attvalues>"
+    return ""
+
+
+def _viz(viz):
+    if viz is None:
+        return ""
+    size, x, y, color = viz
+    return (
+        f'<viz:size value="{size}" />'
+        f'<viz:position x="{x}" y="{y}" />'
+        f'<viz:color r="{color["r"]}" g="{color["g"]}" b="{color["b"]}" a="{color["a"]}" />'
+    )
+
+
+def write_gexf(filename, node_attributes, nodes, edge_attributes, edges, version="1.2draft", compress=False):
+    if version not in NAMESPACES:
+        raise Exception(f"Unsupported GEXF version `{version}`")
+    if compress:
+        file = gzip.open(filename, "wt", encoding="utf8")
+    else:
+        file = open(filename, "w", encoding="utf8")
+    with file:
+        dump_gexf(file, node_attributes, nodes, edge_attributes, edges, version)
+
+
+def dump_gexf(file, node_attributes, nodes, edge_attributes, edges, version="1.2draft"):
+    if version not in NAMESPACES:
+        raise Exception(f"Unsupported GEXF version `{version}`")
+    file.write(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<gexf xmlns="{NAMESPACES[version]}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        f'xsi:schemaLocation="{NAMESPACES[version]} {NAMESPACES[version]}/gexf.xsd" '
+        f'version="{"1.2" if version == "1.2draft" else version}" xmlns:viz="{VIZ_NAMESPACE}">\n'
+        f'<meta lastmodifieddate="{date.today().isoformat()}"><creator>PyPoll</creator></meta>\n'
+        '<graph defaultedgetype="directed" mode="static" name="">\n'
+    )
+    # Node attributes take the first ids and edge attributes continue after them, as `nx.write_gexf` does.
+    for kind, attributes, offset in (("node", node_attributes, 0), ("edge", edge_attributes, len(node_attributes))):
+        file.write(f'<attributes mode="static" class="{kind}">')
+        for index, (title, attribute_type) in enumerate(attributes):
+            file.write(f'<attribute id="{index + offset}" title={quoteattr(title, ENTITIES)} type="{attribute_type}" />')
+        file.write("</attributes>\n")
+    buffer = ["<nodes>\n"]
+    for node, values, viz in nodes:
+        node = quoteattr(str(node), ENTITIES)
+        buffer.append(f"<node id={node} label={node}>{_attvalues(values)}{_viz(viz)}</node>\n")
+        if len(buffer) >= BUFFER_SIZE:
+            file.write("".join(buffer))
+            buffer.clear()
+    buffer.append("</nodes>\n<edges>\n")
+    for index, (source, target, weight, values) in enumerate(edges):
+        buffer.append(
+            f'<edge source={quoteattr(str(source), ENTITIES)} target={quoteattr(str(target), ENTITIES)} id="{index}" weight="{weight}">'
+            f"{_attvalues(values, len(node_attributes))}</edge>\n"
+        )
+        if len(buffer) >= BUFFER_SIZE:
+            file.write("".join(buffer))
+            buffer.clear()
+    buffer.append("</edges>\n</graph>\n</gexf>\n")
+    file.write("".join(buffer))
@@ -1,23 +1,73 @@
-from pypoll.dblib import MongoDB
+from pypoll.dblib import Backend
+from pypoll.graphlib.solver import FJSolver
+from pypoll.graphlib.walk import parallel_random_walks, hit_probabilities
+from pypoll.graphlib.compact import CompactGraph, CompactGraphBuilder, METRICS, from_timestamp
+from pypoll.graphlib.gexf import write_gexf, gexf_type
+from pypoll.metricslib import metrics
 import networkx as nx
 from tqdm import tqdm
-from scipy.sparse import identity
-from scipy.sparse.linalg import inv
 import numpy as np
-import xml.etree.ElementTree as ET
-from itertools import compress, combinations
+from itertools import combinations, repeat
 from collections import Counter
+from datetime import datetime
+import pickle
 import json
+import os
 
 
 class Graph:
     def __init__(self):
         self.mongodb = None
+        self.compact = None
         self.graph = nx.DiGraph()
         self.metadata = dict()
+        self.__users = []
+        self.__followers = dict()
+        self.__follows = dict()
+        self.__lookups = 0
+        self.__fj = None
+        self.__tweets = dict()
+        self.__builder = None
+        self.__unpruned = None
+
+    @property
+    def graph(self):
+        # Compact graphs are only converted to networkx when something needs the networkx object itself.
+        if self.compact is not None:
+            self.__graph = self.compact.to_networkx()
+            self.compact = None
+        return self.__graph
+
+    @graph.setter
+    def graph(self, graph):
+        self.__graph = graph
+        self.compact = None
+
+    def __load_followers(self, options):
+        self.__users = list(options["users"]) if "users" in options else []
+        self.__followers = dict()
+        self.__follows = dict()
+        self.__lookups = 0
+        for index, follows_user in enumerate(self.__users):
+            bit = 1 << index
+            for document in tqdm(self.mongodb.get_usernames(follows_user), desc=f"Loading followers of {follows_user}"):
+                self.__followers[document["username"]] = self.__followers.get(document["username"], 0) | bit
+
+    def __follows_mask(self, username):
+        self.__lookups += 1
+        return self.__followers.get(username, 0)
+
+    def __follows_label(self, username):
+        self.__lookups += 1
+        label = self.__follows.get(username)
+        if label is None:
+            mask = self.__followers.get(username, 0)
+            follows_user_by_selector = [follows_user for index, follows_user in enumerate(self.__users) if mask >> index & 1]
+            label = ",".join(follows_user_by_selector) if len(follows_user_by_selector) else "none"
+            self.__follows[username] = label
+        return label
 
     def __add_node(self, user, options):
-        user_follows_user = []
         if "public_metrics" in user:
             followers = user["public_metrics"]["followers_count"]
             following = user["public_metrics"]["following_count"]
@@ -28,37 +78,79 @@ class Graph:
             following = 0
             tweet = 0
             listed = 0
-        if "users" in options:
-            for follows_user in options["users"]:
-                user_follows_user.append(self.mongodb.exist_username(follows_user, user["username"]))
-            follows_user_by_selector = list(compress(list(options["users"]), user_follows_user))
-            if len(follows_user_by_selector):
-                self.graph.add_node(user["username"], follows=",".join(follows_user_by_selector), followers=followers, following=following, tweet=tweet, listed=listed)
-            else:
-                self.graph.add_node(user["username"], follows="none", followers=followers, following=following, tweet=tweet, listed=listed)
+        if self.__builder is not None:
+            follows = self.__follows_mask(user["username"]) if "users" in options else 0
+            self.__builder.add_node(user["username"], followers, following, tweet, listed, follows)
+        elif "users" in options:
+            self.graph.add_node(user["username"], follows=self.__follows_label(user["username"]), followers=followers, following=following, tweet=tweet, listed=listed)
         else:
             self.graph.add_node(user["username"], followers=followers, following=following, tweet=tweet, listed=listed)
 
     def __add_edge(self, u_of_edge, v_of_edge, created_at):
+        if self.__builder is not None:
+            self.__builder.add_edge(u_of_edge, v_of_edge, created_at)
+            return
         edge = (u_of_edge, v_of_edge)
         if self.graph.has_edge(*edge):
             self.graph[edge[0]][edge[1]]["weight"] += 1
         else:
             self.graph.add_edge(edge[0], edge[1], weight=1, created_at=created_at.strftime("%Y-%m-%d %H:%M:%S"))
 
-    def __add_node_from_tweet(self, hashtag, tweet_id, user, options,):
-        tweet = self.mongodb.get_tweet(hashtag, tweet_id)
+    def __resolve_references(self, hashtag, cursor, reference_type, batch_size):
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield from self.__resolve_batch(hashtag, batch, reference_type)
+                batch = []
+        yield from self.__resolve_batch(hashtag, batch, reference_type)
+
+    def __resolve_batch(self, hashtag, batch, reference_type):
+        tweet_ids = set()
+        for document in batch:
+            for reference in document.get("referenced_tweets", []):
+                if reference["type"] == reference_type and reference["id"] not in self.__tweets:
+                    tweet_ids.add(reference["id"])
+        if len(tweet_ids):
+            for tweet_id in tweet_ids:
+                self.__tweets[tweet_id] = None
+            for tweet in self.mongodb.get_tweets(hashtag, list(tweet_ids)):
+                if self.__tweets[tweet["id"]] is None:
+                    self.__tweets[tweet["id"]] = tweet
+        return batch
+
+    def __add_node_from_tweet(self, tweet_id, user, options):
+        tweet = self.__tweets.get(tweet_id)
         if tweet is not None:
             self.__add_node(tweet["author"], options)
             self.__add_edge(user, tweet["author"]["username"], tweet["created_at"])
 
-    def create_graph(self, hashtag, mongodb, options):
-        if type(mongodb) != MongoDB:
-            raise Exception("The DB must be MongoDB")
-        self.mongodb: MongoDB = mongodb
-        count_documents = mongodb.count_documents(hashtag)
-        cursor = self.mongodb.get_all(hashtag)
-        for index, document in tqdm(enumerate(cursor), total=count_documents):
+    @staticmethod
+    def __projection(edge_type):
+        projection = {"_id": 0, "id": 1, "created_at": 1, "author.username": 1, "author.public_metrics": 1}
+        if edge_type == "mention":
+            projection["entities.mentions.username"] = 1
+        else:
+            projection["referenced_tweets"] = 1
+        return projection
+
+    def __add_documents(self, hashtag, options, since=None, until=None, exclude=None):
+        count_documents = self.mongodb.count_documents(hashtag, since, until)
+        # Only the fields the graph reads are transferred and decoded.
+        cursor = self.mongodb.get_all(
+            hashtag, since, until, self.__projection(options["edge_type"]), options.get("batch_size", 1000), options.get("raw", False)
+        )
+        if options["edge_type"] in ("retweet", "quote"):
+            # Referenced tweets are fetched with one `$in` query per batch of documents instead of one lookup each.
+            self.mongodb.ensure_indexes(hashtag, wait=True)
+            self.__tweets = dict()
+            reference_type = "retweeted" if options["edge_type"] == "retweet" else "quoted"
+            cursor = self.__resolve_references(hashtag, cursor, reference_type, options.get("batch_size", 1000))
+        scanned = 0
+        for document in tqdm(cursor, total=count_documents):
+            if exclude and document.get("id") in exclude:
+                continue
+            scanned += 1
             self.__add_node(document["author"], options)
             if options["edge_type"] == "mention":
                 if "entities" not in document or "mentions" not in document["entities"]:
@@ -71,20 +163,113 @@ class Graph:
                     continue
                 for retweet in document["referenced_tweets"]:
                     if retweet["type"] == "retweeted":
-                        self.__add_node_from_tweet(hashtag, retweet["id"], document["author"]["username"], options)
+                        self.__add_node_from_tweet(retweet["id"], document["author"]["username"], options)
             elif options["edge_type"] == "quote":
                 if "referenced_tweets" not in document:
                     continue
                 for quote in document["referenced_tweets"]:
                     if quote["type"] == "quoted":
-                        self.__add_node_from_tweet(hashtag, quote["id"], document["author"]["username"], options)
+                        self.__add_node_from_tweet(quote["id"], document["author"]["username"], options)
             else:
                 raise Exception("")
+        metrics.count("graph.documents_scanned", scanned, edge_type=options["edge_type"])
+
+    def __add_aggregation(self, hashtag, options, since=None, until=None, exclude=None):
+        for node in tqdm(self.mongodb.aggregate_nodes(hashtag, options["edge_type"], since, until, exclude), desc="Aggregating nodes"):
+            if node["_id"] is None:
+                continue
+            user = {"username": node["_id"]}
+            if node.get("public_metrics") is not None:
+                user["public_metrics"] = node["public_metrics"]
+            self.__add_node(user, options)
+        for edge in tqdm(self.mongodb.aggregate_edges(hashtag, options["edge_type"], since, until, exclude), desc="Aggregating edges"):
+            if edge["_id"].get("source") is None or edge["_id"].get("target") is None:
+                continue
+            if self.__builder is not None:
+                self.__builder.add_edge(edge["_id"]["source"], edge["_id"]["target"], edge["created_at"], edge["weight"])
+            else:
+                self.graph.add_edge(edge["_id"]["source"], edge["_id"]["target"], weight=edge["weight"], created_at=edge["created_at"].strftime("%Y-%m-%d %H:%M:%S"))
+
+    def __build(self, hashtag, options, since=None, until=None, exclude=None):
+        with metrics.timer("graph.load_followers"):
+            self.__load_followers(options)
+        if options.get("compact", False):
+            self.__builder = CompactGraphBuilder(self.__users if "users" in options else None)
+        else:
+            self.graph = nx.DiGraph()
+        if options.get("aggregate", False):
+            with metrics.timer("graph.scan", edge_type=options["edge_type"], mode="aggregate"):
+                self.__add_aggregation(hashtag, options, since, until, exclude)
+        else:
+            with metrics.timer("graph.scan", edge_type=options["edge_type"], mode="documents"):
+                self.__add_documents(hashtag, options, since, until, exclude)
+        if self.__builder is not None:
+            with metrics.timer("graph.compact"):
+                self.compact = self.__builder.build()
+            self.__builder = None
+        if len(self.__users):
+            # One in-memory lookup per user replaces a query per follower collection.
+            round_trips_saved = self.__lookups * len(self.__users) - len(self.__users)
+            metrics.count("graph.follower_lookups", self.__lookups)
+            metrics.count("graph.round_trips_saved", round_trips_saved)
+            print(f"Resolved {self.__lookups} follower lookups in memory, {round_trips_saved} fewer database round trips.")
+
+    def __remove_nodes(self, nodes):
+        if self.__unpruned is not None:
+            self.__unpruned.add_nodes_from((node, self.graph.nodes[node]) for node in nodes)
+            for u_of_edge, v_of_edge, attributes in list(self.graph.in_edges(nodes, data=True)) + list(self.graph.out_edges(nodes, data=True)):
+                self.__unpruned.add_node(u_of_edge, **self.graph.nodes[u_of_edge])
+                self.__unpruned.add_node(v_of_edge, **self.graph.nodes[v_of_edge])
+                self.__unpruned.add_edge(u_of_edge, v_of_edge, **attributes)
+        self.graph.remove_nodes_from(nodes)
+
+    def __prune(self, options):
+        # Pruning depends on the whole graph, so an update is merged into the unpruned graph, which is then pruned again.
+        # With `keep_unpruned`, only the part that pruning removes is kept, and it is saved with `.npz` and `.pypoll` files.
+        keep_unpruned = options.get("keep_unpruned", False) and (options["giant_component"] or options["remove_leaf_nodes"])
+        self.__unpruned = None
+        if self.compact is not None:
+            keep = self.compact.pruned_nodes(options["giant_component"], options["remove_leaf_nodes"])
+            if keep_unpruned:
+                self.__unpruned = self.compact.removed(keep)
+            self.compact = self.compact.subgraph(keep)
+            return
+        if keep_unpruned:
+            self.__unpruned = nx.DiGraph()
         if options["giant_component"]:
-            self.graph.remove_nodes_from(list(nx.isolates(self.graph)))
-            self.graph = self.graph.subgraph(max(nx.connected_components(self.graph.to_undirected()), key=len)).copy()
+            self.__remove_nodes(list(nx.isolates(self.graph)))
+            component = max(nx.connected_components(self.graph.to_undirected()), key=len)
+            self.__remove_nodes([node for node in self.graph if node not in component])
         if options["remove_leaf_nodes"]:
-            self.graph.remove_nodes_from([node for node, degree in dict(self.graph.degree()).items() if degree == 1])
+            self.__remove_nodes([node for node, degree in dict(self.graph.degree()).items() if degree == 1])
+
+    def __restore_unpruned(self):
+        if self.compact is not None:
+            removed = self.__unpruned
+            if not isinstance(removed, CompactGraph):
+                removed = CompactGraph.from_networkx(removed, self.__compact_users())
+            self.compact.merge(removed)
+        else:
+            removed = self.__unpruned
+            if isinstance(removed, CompactGraph):
+                removed = removed.to_networkx()
+            self.graph.add_nodes_from(removed.nodes(data=True))
+            self.graph.add_edges_from(removed.edges(data=True))
+
+    def __set_date_range(self, hashtag, until):
+        # The mark is inclusive, the tweets at exactly the mark are remembered so that an update does not count them twice.
+        self.metadata["high_water_mark"] = until.isoformat()
+        self.metadata["high_water_ids"] = [document["id"] for document in self.mongodb.get_all(hashtag, until, until, {"_id": 0, "id": 1})]
+        self.metadata["description"] = f"From {self.mongodb.get_created_date(hashtag, 'ASC').strftime('%Y-%m-%d')} until {until.strftime('%Y-%m-%d')}"
+
+    def create_graph(self, hashtag, mongodb, options):
+        if not isinstance(mongodb, Backend):
+            raise Exception("The DB must be a storage backend, e.g. MongoDB or ParquetStore")
+        self.mongodb: Backend = mongodb
+        until = self.mongodb.get_created_date(hashtag, "DES")
+        self.__build(hashtag, options, until=until)
+        with metrics.timer("graph.prune"):
+            self.__prune(options)
         self.metadata["source"] = "Twitter"
         if "users" in options:
             options["users"] = {index: value for index, value in enumerate(options["users"])}
@@ -93,83 +278,284 @@ class Graph:
             "nodes": self.get_number_of_nodes(),
             "edges": self.get_number_of_edges(),
         }
-        self.metadata["description"] = f"From {self.mongodb.get_created_date(hashtag, 'ASC').strftime('%Y-%m-%d')} until {self.mongodb.get_created_date(hashtag, 'DES').strftime('%Y-%m-%d')}"
+        self.__set_date_range(hashtag, until)
+
+    def __to_compact(self):
+        if self.compact is not None:
+            return self.compact
+        return CompactGraph.from_networkx(self.graph, self.__compact_users())
+
+    def __compact_users(self):
+        if "options" in self.metadata and "users" in self.metadata["options"]:
+            return self.__seed_users()
+        return None
+
+    def __seed_users(self):
+        users = list(self.metadata["options"]["users"].items())
+        if all(type(value) == str for key, value in users):
+            return [value for key, value in users]
+        return [key for key, value in users]
+
+    def __merge_compact(self, hashtag, options, since, until, exclude):
+        compact = self.compact
+        self.__build(hashtag, options, since, until, exclude)
+        update, self.compact = self.compact, compact
+        self.compact.merge(update)
+        if "users" in options:
+            self.compact.follows = np.array([self.__followers.get(username, 0) for username in self.compact.usernames], dtype=np.int64)
+
+    def __merge_graph(self, hashtag, options, since, until, exclude):
+        graph = self.graph
+        self.__build(hashtag, options, since, until, exclude)
+        update, self.graph = self.graph, graph
+        for node, attributes in update.nodes(data=True):
+            # Existing nodes keep their attributes, which come from their oldest occurrence just like in a full build.
+            if not self.graph.has_node(node):
+                self.graph.add_node(node, **attributes)
+        if "users" in options:
+            for node, attributes in self.graph.nodes(data=True):
+                attributes["follows"] = self.__follows_label(node)
+        for u_of_edge, v_of_edge, attributes in update.edges(data=True):
+            if self.graph.has_edge(u_of_edge, v_of_edge):
+                self.graph[u_of_edge][v_of_edge]["weight"] += attributes["weight"]
+                self.graph[u_of_edge][v_of_edge]["created_at"] = attributes["created_at"]
+            else:
+                self.graph.add_edge(u_of_edge, v_of_edge, **attributes)
+
+    def update_graph(self, hashtag, mongodb):
+        if not isinstance(mongodb, Backend):
+            raise Exception("The DB must be a storage backend, e.g. MongoDB or ParquetStore")
+        if "high_water_mark" not in self.metadata:
+            raise Exception("The graph has no high-water mark, create it again with `create_graph`")
+        options = dict(self.metadata["options"])
+        pruned = options["giant_component"] or options["remove_leaf_nodes"]
+        if pruned and self.__unpruned is None:
+            raise Exception(
+                "The graph was pruned without `keep_unpruned`, create it again with `keep_unpruned` to update it "
+                "and save it as `.npz` or `.pypoll` to update it after loading"
+            )
+        self.mongodb: Backend = mongodb
+        since = datetime.fromisoformat(self.metadata["high_water_mark"])
+        exclude = set(self.metadata.get("high_water_ids", []))
+        until = self.mongodb.get_created_date(hashtag, "DES")
+        if until is None or until < since:
+            print(f"No tweets newer than {since} in `{hashtag}`.")
+            return
+        if "users" in options:
+            options["users"] = self.__seed_users()
+        if pruned:
+            self.__restore_unpruned()
+        options["compact"] = self.compact is not None
+        if self.compact is not None:
+            self.__merge_compact(hashtag, options, since, until, exclude)
+        else:
+            self.__merge_graph(hashtag, options, since, until, exclude)
+        self.__prune(options)
+        self.metadata["graph_properties"] = {
+            "nodes": self.get_number_of_nodes(),
+            "edges": self.get_number_of_edges(),
+        }
+        self.__set_date_range(hashtag, until)
+
+    @staticmethod
+    def __split_filename(filename):
+        compress = filename.endswith(".gz")
+        if compress:
+            filename = filename[:-len(".gz")]
+        return filename, filename.split(".")[-1], compress
+
+    def __gexf_nodes(self, viz=None):
+        if viz is None:
+            viz = repeat(None)
+        if self.compact is not None:
+            labels = self.compact.labels() if self.compact.users is not None else None
+            attributes = ([("follows", "string")] if labels is not None else []) + [(metric, "long") for metric in METRICS]
+            rows = (
+                (username, ([labels[index]] if labels is not None else []) + metrics, node_viz)
+                for index, (username, metrics, node_viz) in enumerate(zip(self.compact.usernames, self.compact.metrics.tolist(), viz))
+            )
+            return attributes, rows
+        titles = dict()
+        for node, att in self.graph.nodes(data=True):
+            for key, value in att.items():
+                if key not in ("label", "viz") and key not in titles and value is not None:
+                    titles[key] = gexf_type(value)
+        rows = ((node, [att.get(title) for title in titles], node_viz) for (node, att), node_viz in zip(self.graph.nodes(data=True), viz))
+        return list(titles.items()), rows
+
+    def __gexf_edges(self):
+        if self.compact is not None:
+            usernames = self.compact.usernames
+            rows = (
+                (usernames[source], usernames[target], weight, [from_timestamp(created_at)])
+                for source, target, weight, created_at in zip(self.compact.source.tolist(), self.compact.target.tolist(), self.compact.weight.tolist(), self.compact.created_at.tolist())
+            )
+            return [("created_at", "string")], rows
+        titles = dict()
+        for u_of_edge, v_of_edge, att in self.graph.edges(data=True):
+            for key, value in att.items():
+                if key not in ("id", "label", "weight") and key not in titles and value is not None:
+                    titles[key] = gexf_type(value)
+        rows = ((u_of_edge, v_of_edge, att.get("weight", 1), [att.get(title) for title in titles]) for u_of_edge, v_of_edge, att in self.graph.edges(data=True))
+        return list(titles.items()), rows
+
+    def __networkx(self):
+        # Formats that need networkx get a temporary copy, a compact graph stays compact for `fj`, `rwc` and `.pypoll`.
+        if self.compact is not None:
+            return self.compact.to_networkx()
+        return self.graph
 
     def save_as(self, filename):
-        filetype = filename.split(".")[-1]
+        path, filetype, compress = self.__split_filename(filename)
+        if compress and filetype != "gexf":
+            raise Exception("Only gexf files can be compressed")
         if filetype == "gexf":
-            nx.write_gexf(self.graph, filename, version="1.2draft")
+            write_gexf(filename, *self.__gexf_nodes(), *self.__gexf_edges(), compress=compress)
         elif filetype == "gml":
-            nx.write_gml(self.graph, filename)
+            nx.write_gml(self.__networkx(), filename)
         elif filetype == "json":
-            graph_file = open(filename, "w", encoding="utf8")
-            json.dump(nx.node_link_data(self.graph), graph_file, ensure_ascii=False)
+            with open(filename, "w", encoding="utf8") as graph_file:
+                json.dump(nx.node_link_data(self.__networkx()), graph_file, ensure_ascii=False)
         elif filetype == "gpickle":
-            nx.write_gpickle(self.graph, filename)
+            with open(filename, "wb") as graph_file:
+                pickle.dump(self.__networkx(), graph_file, pickle.HIGHEST_PROTOCOL)
+        elif filetype == "npz":
+            self.__to_compact().save(filename)
+        elif filetype == "pypoll":
+            self.__to_compact().save_directory(filename)
         else:
             raise Exception("")
+        if filetype in ("npz", "pypoll"):
+            self.__save_unpruned(filename)
+        else:
+            self.metadata["unpruned"] = False
         self.__metadata_save_as(filename)
+        if metrics.enabled:
+            metrics.count("graph.bytes_written", self.__size(filename), format=filetype)
+
+    @staticmethod
+    def __size(filename):
+        if os.path.isdir(filename):
+            return sum(os.path.getsize(os.path.join(filename, name)) for name in os.listdir(filename))
+        return os.path.getsize(filename)
+
+    @staticmethod
+    def __unpruned_filename(filename):
+        unpruned_filename = filename.split(".")
+        unpruned_filename.insert(-1, "unpruned")
+        return ".".join(unpruned_filename)
+
+    def __save_unpruned(self, filename):
+        # The metadata says whether the file has one, so a file left over from an earlier save is never read.
+        self.metadata["unpruned"] = self.__unpruned is not None
+        if self.__unpruned is None:
+            return
+        unpruned_filename = self.__unpruned_filename(filename)
+        removed = self.__unpruned
+        if not isinstance(removed, CompactGraph):
+            removed = CompactGraph.from_networkx(removed, self.__compact_users())
+        if filename.endswith(".npz"):
+            removed.save(unpruned_filename)
+        else:
+            removed.save_directory(unpruned_filename)
 
     def __metadata_save_as(self, filename):
-        metadata_filename = filename.split(".")
+        metadata_filename = self.__split_filename(filename)[0].split(".")
         metadata_filename[-1] = "metadata.json"
-        metadata_file = open(".".join(metadata_filename), "w", encoding="utf8")
-        json.dump(self.metadata, metadata_file, ensure_ascii=False)
+        with open(".".join(metadata_filename), "w", encoding="utf8") as metadata_file:
+            json.dump(self.metadata, metadata_file, ensure_ascii=False)
 
     def load(self, filename):
-        filetype = filename.split(".")[-1]
+        path, filetype, compress = self.__split_filename(filename)
         if filetype == "gexf":
             self.graph = nx.read_gexf(filename)
         elif filetype == "gml":
             self.graph = nx.read_gml(filename)
         elif filetype == "json":
-            graph_file = open(filename, "r", encoding="utf8")
-            self.graph = nx.node_link_graph(json.load(graph_file))
+            with open(filename, "r", encoding="utf8") as graph_file:
+                self.graph = nx.node_link_graph(json.load(graph_file))
         elif filetype == "gpickle":
-            self.graph = nx.read_gpickle(filename)
+            with open(filename, "rb") as graph_file:
+                self.graph = pickle.load(graph_file)
+        elif filetype == "npz":
+            self.compact = CompactGraph.load(filename)
+        elif filetype == "pypoll":
+            self.compact = CompactGraph.load_directory(filename)
         else:
             raise Exception("")
-        metadata_filename = filename.split(".")
+        metadata_filename = path.split(".")
         metadata_filename[-1] = "metadata.json"
-        metadata_file = open(".".join(metadata_filename), "r", encoding="utf8")
-        self.metadata = json.load(metadata_file)
+        with open(".".join(metadata_filename), "r", encoding="utf8") as metadata_file:
+            self.metadata = json.load(metadata_file)
+        self.__unpruned = None
+        if self.metadata.get("unpruned", False) and filetype == "npz":
+            self.__unpruned = CompactGraph.load(self.__unpruned_filename(filename))
+        elif self.metadata.get("unpruned", False) and filetype == "pypoll":
+            self.__unpruned = CompactGraph.load_directory(self.__unpruned_filename(filename))
 
     def get_graph(self):
         return self.graph
 
     def get_number_of_nodes(self):
+        if self.compact is not None:
+            return self.compact.number_of_nodes()
         return self.graph.number_of_nodes()
 
     def get_number_of_edges(self):
+        if self.compact is not None:
+            return self.compact.number_of_edges()
         return self.graph.number_of_edges()
 
-    def fj(self, user_A, user_B):
-        undirected_graph = self.graph.to_undirected()
-        internal_opinion = []
-        for node in undirected_graph.nodes(data=True):
-            if node[1]["follows"] == user_A:
-                internal_opinion.append([1])
-            elif node[1]["follows"] == user_B:
-                internal_opinion.append([-1])
-            else:
-                internal_opinion.append([0])
-        laplacian = nx.laplacian_matrix(undirected_graph)
-        identity_matrix = identity(undirected_graph.number_of_nodes())
-        inverse = inv(laplacian + identity_matrix)
-        expressed_opinion = inverse.dot(internal_opinion)
-        return np.power(np.linalg.norm(expressed_opinion), 2) / undirected_graph.number_of_nodes()
-
-    def get_polarization(self, methods):
+    def __follows_labels(self):
+        if self.compact is not None:
+            return self.compact.labels()
+        return np.array([att["follows"] for node, att in self.graph.nodes(data=True)], dtype=object)
+
+    def __adjacency(self, weight=None):
+        if self.compact is not None:
+            return self.compact.adjacency(weight is not None)
+        return nx.to_scipy_sparse_array(self.graph, weight=weight, format="csr")
+
+    def __create_fj_solver(self, options):
+        follows = self.__follows_labels()
+        if self.compact is not None:
+            laplacian = self.compact.laplacian()
+        else:
+            laplacian = nx.laplacian_matrix(self.graph.to_undirected())
+        with metrics.timer("solver.factorize", method=options.get("solver", "cg")):
+            return FJSolver(laplacian, options.get("solver", "cg"), options.get("tol", 1e-8)), follows
+
+    def fj(self, user_A, user_B, options=None):
+        if options is None:
+            options = dict()
+        if self.__fj is None:
+            solver, follows = self.__create_fj_solver(options)
+        else:
+            solver, follows = self.__fj
+        internal_opinion = np.zeros(len(follows))
+        internal_opinion[follows == user_A] = 1
+        internal_opinion[follows == user_B] = -1
+        expressed_opinion = solver.solve(internal_opinion)
+        return np.power(np.linalg.norm(expressed_opinion), 2) / len(follows)
+
+    def get_polarization(self, methods, options=None):
+        if options is None:
+            options = dict()
         self.metadata["graph_properties"]["polarization"] = {method: dict() for method in methods}
         pairs = list(combinations([self.metadata["options"]["users"][item] for item in self.metadata["options"]["users"]], 2))
         for method in methods:
+            if method == "fj":
+                # (I + L) only depends on the graph, so its solver is set up once and reused for every pair.
+                self.__fj = self.__create_fj_solver(options)
             for pair in tqdm(pairs, total=len(pairs)):
-                if method == "fj":
-                    self.metadata["graph_properties"]["polarization"][method]["|".join(pair)] = self.fj(pair[0], pair[1])
-                elif method == "rwc":
-                    self.metadata["graph_properties"]["polarization"][method]["|".join(pair)] = self.rwc(pair[0], pair[1])
-                else:
-                    raise Exception("")
+                with metrics.timer("graph.polarization", method=method):
+                    if method == "fj":
+                        self.metadata["graph_properties"]["polarization"][method]["|".join(pair)] = self.fj(pair[0], pair[1], options)
+                    elif method == "rwc":
+                        self.metadata["graph_properties"]["polarization"][method]["|".join(pair)] = self.rwc(pair[0], pair[1], options.get("k"), options)
+                    else:
+                        raise Exception("")
+            self.__fj = None
         return self.metadata["graph_properties"]["polarization"]
 
     def __set_combinations_to_metadata_entities(self, follows_color):
@@ -185,94 +571,77 @@ class Graph:
                 }
 
     def create_layout(self, save_to_file: str, options):
-        filetype = save_to_file.split(".")[-1]
+        path, filetype, compress = self.__split_filename(save_to_file)
         if filetype != "gexf":
             raise Exception("The file must be gexf type")
         print("Creating layout...")
         self.metadata["options"]["users"] = options["users"]
         follows_color = {item: self.metadata["options"]["users"][item]["color"] for item in self.metadata["options"]["users"]}
         follows_color["none"] = {"r": 210, "g": 210, "b": 210, "a": 1}
-        pos = nx.spring_layout(self.graph, scale=options["scale"])
-        gexf = [line for line in nx.generate_gexf(self.graph, version="1.2draft")]
-        tree = ET.ElementTree(ET.fromstringlist(gexf))
-        attributes = []
-        namespace = "http://www.gexf.net/1.2draft"
-        for element in tqdm(tree.iter(), total=len(gexf)):
-            if f"{'{' + namespace + '}'}gexf" == element.tag:
-                element.set("xmlns:viz", "http://gexf.net/1.3/viz")
-            elif f"{'{' + namespace + '}'}attribute" == element.tag:
-                attributes.append(element.attrib)
-            elif f"{'{' + namespace + '}'}node" == element.tag:
-                el_attr = list(list(element)[0])
-                for obj in attributes:
-                    if obj.get("title") == "follows":
-                        get_el_attr = el_attr[int(obj.get("id"))]
-                        if get_el_attr.attrib.get("value") in self.metadata["options"]["users"]:
-                            color = follows_color.get(get_el_attr.attrib.get("value"))
-                        else:
-                            color = follows_color["none"]
-                        color = {i: str(color[i]) for i in color}
-                element.append(element.makeelement("viz:size", dict(value=str(options["node_size"]))))
-                node_pos = pos.get(element.attrib.get("id"))
-                element.append(element.makeelement("viz:position", dict(x=str(node_pos[0]), y=str(node_pos[1]))))
-                element.append(element.makeelement("viz:color", color))
-        ET.register_namespace("", namespace)
-        tree.write(save_to_file)
+        with metrics.timer("graph.layout", layout=options.get("layout", "forceatlas2")):
+            if options.get("layout", "forceatlas2") == "spring":
+                graph = self.__networkx()
+                pos = nx.spring_layout(graph, scale=options["scale"])
+                positions = [pos[node] for node in graph.nodes]
+            elif options.get("layout", "forceatlas2") == "forceatlas2":
+                # scipy.fft is only needed for layouts, so it is not imported with the graph.
+                from pypoll.graphlib.layout import force_atlas2
+                positions = force_atlas2(self.__adjacency("weight"), options)
+            else:
+                raise Exception(f"Unknown layout `{options['layout']}`")
+        if self.compact is not None and self.compact.users is None:
+            follows = repeat("none")
+        elif self.compact is None and not all("follows" in att for node, att in self.graph.nodes(data=True)):
+            follows = repeat("none")
+        else:
+            follows = self.__follows_labels()
+        viz = (
+            (options["node_size"], x, y, follows_color.get(label, follows_color["none"]))
+            for (x, y), label in zip(positions, follows)
+        )
+        write_gexf(save_to_file, *self.__gexf_nodes(viz), *self.__gexf_edges(), options.get("gexf_version", "1.2draft"), compress)
         self.__metadata_save_as(save_to_file)
 
-    def __random_walk(self, start_node, end_nodes):
-        first_node = start_node
-        while True:
-            neighbors = list(self.graph.neighbors(start_node))
-            random_num = random.randint(0, len(neighbors) - 1)
-            start_node = neighbors[random_num]
-            if start_node == first_node:
-                continue
-            if start_node in end_nodes:
-                break
-        return (first_node, self.graph.nodes[first_node]), (start_node, self.graph.nodes[start_node])
-
-    def rwc(self, user_A, user_B, k=None):
-        central_nodes = sorted(self.graph.degree, key=lambda x: x[1], reverse=True)
-        central_l_nodes = []
-        central_r_nodes = []
-        for node in central_nodes:
-            follows = self.graph.nodes(data="follows")[node[0]]
-            if follows == user_A:
-                central_l_nodes.append(node[0])
-            elif follows == user_B:
-                central_r_nodes.append(node[0])
-        if k is not None:
-            central_l_nodes = central_l_nodes[:k]
-            central_r_nodes = central_r_nodes[:k]
-        end_nodes = central_l_nodes + central_r_nodes
-        start_user_A = [node for node, att in self.graph.nodes(data=True) if att["follows"] == user_A]
-        start_user_B = [node for node, att in self.graph.nodes(data=True) if att["follows"] == user_B]
-        walks = []
-        for _ in range(10000):
-            walks.append(self.__random_walk(random.choice(start_user_A), end_nodes))
-            walks.append(self.__random_walk(random.choice(start_user_B), end_nodes))
-        c_ll = 0
-        c_rr = 0
-        c_lr = 0
-        c_rl = 0
-        c_ln = 0
-        c_rn = 0
-        for walk in walks:
-            start = walk[0]
-            end = walk[1]
-            if start[1]["follows"] == user_A and end[0] in central_l_nodes:
-                c_ll += 1
-            elif start[1]["follows"] == user_B and end[0] in central_r_nodes:
-                c_rr += 1
-            elif start[1]["follows"] == user_A and end[0] in central_r_nodes:
-                c_lr += 1
-            elif start[1]["follows"] == user_B and end[0] in central_l_nodes:
-                c_rl += 1
-            elif start[1]["follows"] == user_A and end[1]["follows"] not in [user_A, user_B]:
-                c_ln += 1
-            elif start[1]["follows"] == user_B and end[1]["follows"] not in [user_A, user_B]:
-                c_rn += 1
+    def rwc(self, user_A, user_B, k=None, options=None):
+        if options is None:
+            options = dict()
+        follows = self.__follows_labels()
+        adjacency = self.__adjacency()
+        degree = np.diff(adjacency.indptr) + np.bincount(adjacency.indices, minlength=len(follows))
+        central_nodes = np.argsort(-degree, kind="stable")
+        central_l_nodes = central_nodes[follows[central_nodes] == user_A][:k]
+        central_r_nodes = central_nodes[follows[central_nodes] == user_B][:k]
+        end_nodes = np.zeros(len(follows), dtype=bool)
+        end_nodes[central_l_nodes] = True
+        end_nodes[central_r_nodes] = True
+        is_l_node = np.zeros(len(follows), dtype=bool)
+        is_l_node[central_l_nodes] = True
+        start_A = np.flatnonzero(follows == user_A)
+        start_B = np.flatnonzero(follows == user_B)
+        if options.get("method", "sampled") == "exact":
+            probabilities = hit_probabilities(
+                adjacency, end_nodes, is_l_node, np.concatenate([start_A, start_B]), options.get("tol", 1e-8),
+                options.get("max_end_starts", 256), options.get("walks", 10000), options.get("max_steps", 100000), options.get("seed")
+            )
+            c_ll, c_lr = probabilities[:len(start_A)].mean(axis=0)
+            c_rl, c_rr = probabilities[len(start_A):].mean(axis=0)
+        elif options.get("method", "sampled") == "sampled":
+            walks = options.get("walks", 10000)
+            start_seed, walk_seed = np.random.SeedSequence(options.get("seed")).spawn(2)
+            rng = np.random.default_rng(start_seed)
+            starts = np.concatenate([rng.choice(start_A, walks), rng.choice(start_B, walks)])
+            ends = parallel_random_walks(
+                adjacency.indptr, adjacency.indices, starts, end_nodes,
+                options.get("max_steps", 100000), walk_seed, options.get("workers", 1)
+            )
+            ends_A, ends_B = ends[:walks], ends[walks:]
+            ends_A, ends_B = ends_A[ends_A >= 0], ends_B[ends_B >= 0]
+            c_ll = np.count_nonzero(is_l_node[ends_A])
+            c_lr = len(ends_A) - c_ll
+            c_rl = np.count_nonzero(is_l_node[ends_B])
+            c_rr = len(ends_B) - c_rl
+        else:
+            raise Exception(f"Unknown RWC method `{options['method']}`")
         p_ll = c_ll / (c_ll + c_rl)
         p_rr = c_rr / (c_rr + c_lr)
         p_lr = c_lr / (c_lr + c_rr)
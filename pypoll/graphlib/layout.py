@@ -0,0 +1,94 @@
+from scipy.fft import rfft2, irfft2
+import numpy as np
+import time
+
+
+def rescale_layout(positions, scale=1):
+    positions = positions - positions.mean(axis=0)
+    limit = np.abs(positions).max()
+    if limit > 0:
+        positions *= scale / limit
+    return positions
+
+
+def _repulsion_kernel(grid_size, cell_size, workers):
+    offsets = np.fft.fftfreq(2 * grid_size, 1 / (2 * grid_size))
+    dx, dy = np.meshgrid(offsets, offsets, indexing="ij")
+    distance = dx ** 2 + dy ** 2
+    distance[0, 0] = 1
+    kernel_x, kernel_y = dx / distance / cell_size, dy / distance / cell_size
+    kernel_x[0, 0] = kernel_y[0, 0] = 0
+    return rfft2(kernel_x, workers=workers), rfft2(kernel_y, workers=workers)
+
+
+def _repulsion(positions, mass, grid_size, workers):
+    # Particle-mesh approximation of the all-pairs `mass_i * mass_j / distance` repulsion: masses are spread on a grid
+    # with cloud-in-cell weights, convolved with the force kernel through FFTs and interpolated back to the nodes.
+    low = positions.min(axis=0)
+    cell_size = max((positions.max(axis=0) - low).max() / (grid_size - 1), 1e-9)
+    grid = (positions - low) / cell_size
+    cell = np.minimum(np.floor(grid).astype(np.int64), grid_size - 2)
+    fraction = grid - cell
+    corners = [(0, 0), (1, 0), (0, 1), (1, 1)]
+    weights = [
+        (1 - fraction[:, 0]) * (1 - fraction[:, 1]), fraction[:, 0] * (1 - fraction[:, 1]),
+        (1 - fraction[:, 0]) * fraction[:, 1], fraction[:, 0] * fraction[:, 1]
+    ]
+    flat = [(cell[:, 0] + x) * (2 * grid_size) + cell[:, 1] + y for x, y in corners]
+    density = np.zeros((2 * grid_size) ** 2)
+    for index, weight in zip(flat, weights):
+        density += np.bincount(index, weights=mass * weight, minlength=len(density))
+    density = rfft2(density.reshape(2 * grid_size, 2 * grid_size), workers=workers)
+    kernel_x, kernel_y = _repulsion_kernel(grid_size, cell_size, workers)
+    field_x = irfft2(density * kernel_x, s=(2 * grid_size, 2 * grid_size), workers=workers).ravel()
+    field_y = irfft2(density * kernel_y, s=(2 * grid_size, 2 * grid_size), workers=workers).ravel()
+    force = np.zeros_like(positions)
+    for index, weight in zip(flat, weights):
+        force[:, 0] += field_x[index] * weight
+        force[:, 1] += field_y[index] * weight
+    return force * mass[:, None]
+
+
+def force_atlas2(adjacency, options=None):
+    if options is None:
+        options = dict()
+    started = time.perf_counter()
+    n = adjacency.shape[0]
+    rng = np.random.default_rng(options.get("seed"))
+    positions = rng.uniform(-1, 1, (n, 2)) * np.sqrt(n)
+    if n < 2:
+        return rescale_layout(positions, options.get("scale", 1))
+    undirected = (adjacency + adjacency.T).tocoo()
+    upper = undirected.row < undirected.col
+    source, target, weight = undirected.row[upper], undirected.col[upper], undirected.data[upper].astype(float)
+    mass = np.bincount(np.concatenate([source, target]), minlength=n) + 1.0
+    repulsion, gravity = options.get("repulsion", 2.0), options.get("gravity", 1.0)
+    grid_size = options.get("grid_size", int(min(1024, max(16, np.sqrt(n / 2)))))
+    workers = options.get("workers")
+    speed, previous = 1.0, np.zeros_like(positions)
+    for _ in range(options.get("iterations", 100)):
+        force = repulsion * _repulsion(positions, mass, grid_size, workers)
+        delta = positions[source] - positions[target]
+        attraction = delta * weight[:, None]
+        for axis in range(2):
+            force[:, axis] -= np.bincount(source, weights=attraction[:, axis], minlength=n)
+            force[:, axis] += np.bincount(target, weights=attraction[:, axis], minlength=n)
+        distance = np.maximum(np.linalg.norm(positions, axis=1), 1e-9)
+        force -= gravity * (mass / distance)[:, None] * positions
+        # ForceAtlas2 adaptive speed: nodes that oscillate ("swing") slow down, nodes moving consistently speed up.
+        swinging = mass * np.linalg.norm(force - previous, axis=1)
+        traction = mass * np.linalg.norm(force + previous, axis=1) / 2
+        total_swinging, total_traction = swinging.sum(), traction.sum()
+        jitter_tolerance = max(np.sqrt(0.05 * np.sqrt(n)), min(10, 0.05 * np.sqrt(n) * total_traction / n ** 2))
+        target_speed = jitter_tolerance * total_traction / max(total_swinging, 1e-9)
+        speed += min(target_speed - speed, 0.5 * speed)
+        factor = speed / (1 + np.sqrt(speed * swinging))
+        step = force * factor[:, None]
+        length = np.linalg.norm(step, axis=1)
+        limit = 10 * np.sqrt(n)
+        step[length > limit] *= (limit / length[length > limit])[:, None]
+        positions += step
+        previous = force
+        if options.get("time_budget") is not None and time.perf_counter() - started > options["time_budget"]:
+            break
+    return rescale_layout(positions, options.get("scale", 1))
@@ -0,0 +1,37 @@
+from scipy.sparse import identity, diags
+from scipy.sparse.linalg import splu, cg
+from pypoll.metricslib import metrics
+
+
+class FJSolver:
+    def __init__(self, laplacian, method="cg", tol=1e-8):
+        self.method = method
+        self.tol = tol
+        self.iterations = 0
+        self.matrix = (laplacian + identity(laplacian.shape[0], format="csc")).tocsc().astype(float)
+        if method == "direct":
+            # I + L is symmetric positive definite, so a symmetric fill-reducing ordering keeps the factors sparse. On
+            # scale-free graphs the hubs still fill the factors in, so this is only the better choice for small graphs.
+            self.lu = splu(self.matrix, permc_spec="MMD_AT_PLUS_A")
+        elif method == "cg":
+            # I + L is diagonally dominant, so Jacobi-preconditioned CG converges in few iterations at any size.
+            self.preconditioner = diags(1 / self.matrix.diagonal())
+        else:
+            raise Exception(f"Unknown FJ solver `{method}`")
+
+    def __callback(self, xk):
+        self.iterations += 1
+
+    def solve(self, internal_opinion):
+        metrics.count("solver.solves", method=self.method)
+        if self.method == "direct":
+            return self.lu.solve(internal_opinion)
+        iterations = self.iterations
+        try:
+            expressed_opinion, info = cg(self.matrix, internal_opinion, rtol=self.tol, M=self.preconditioner, callback=self.__callback)
+        except TypeError:
+            expressed_opinion, info = cg(self.matrix, internal_opinion, tol=self.tol, M=self.preconditioner, callback=self.__callback)
+        metrics.count("solver.iterations", self.iterations - iterations, method=self.method)
+        if info != 0:
+            raise Exception(f"Conjugate gradient did not converge to tolerance {self.tol}")
+        return expressed_opinion
@@ -0,0 +1,113 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from scipy.sparse import csr_matrix, diags, identity
+from scipy.sparse.csgraph import breadth_first_order
+from scipy.sparse.linalg import gmres
+import numpy as np
+
+
+def random_walks(indptr, indices, starts, end_nodes, max_steps, seed):
+    rng = np.random.default_rng(seed)
+    degree = np.diff(indptr)
+    current = starts.copy()
+    ends = np.full(len(starts), -1, dtype=np.int64)
+    active = np.arange(len(starts))
+    for _ in range(max_steps):
+        if not len(active):
+            break
+        position = current[active]
+        # Walkers on nodes without out-neighbors are stuck and finish without reaching an end node.
+        alive = degree[position] > 0
+        active = active[alive]
+        position = position[alive]
+        step = (rng.random(len(active)) * degree[position]).astype(np.int64)
+        position = indices[indptr[position] + step]
+        current[active] = position
+        hit = end_nodes[position] & (position != starts[active])
+        ends[active[hit]] = position[hit]
+        active = active[~hit]
+    return ends
+
+
+def parallel_random_walks(indptr, indices, starts, end_nodes, max_steps=100000, seed=None, workers=1):
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(workers)
+    if workers == 1:
+        return random_walks(indptr, indices, starts, end_nodes, max_steps, seeds[0])
+    chunks = np.array_split(starts, workers)
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(random_walks, repeat(indptr), repeat(indices), chunks, repeat(end_nodes), repeat(max_steps), seeds)
+        return np.concatenate(list(results))
+
+
+def solve(matrix, b, x0=None, preconditioner=None, tol=1e-8):
+    try:
+        x, info = gmres(matrix, b, x0=x0, rtol=tol, M=preconditioner)
+    except TypeError:
+        x, info = gmres(matrix, b, x0=x0, tol=tol, M=preconditioner)
+    if info != 0:
+        raise Exception(f"GMRES did not converge to tolerance {tol}")
+    return x
+
+
+def hit_probabilities(adjacency, end_nodes, l_nodes, starts, tol=1e-8, max_end_starts=256, walks=10000, max_steps=100000, seed=None):
+    adjacency = csr_matrix(adjacency)
+    n = adjacency.shape[0]
+    degree = np.diff(adjacency.indptr)
+    transition = (diags(np.divide(1, degree, out=np.zeros(n), where=degree > 0)) @ adjacency).tocsr()
+    # Walkers stop on end nodes and dead ends; nodes that can reach neither would walk forever and never hit.
+    exits = end_nodes | (degree == 0)
+    edges = adjacency.tocoo()
+    exit_nodes = np.flatnonzero(exits)
+    augmented = csr_matrix((
+        np.ones(len(edges.row) + len(exit_nodes), dtype=np.int8),
+        (np.concatenate([edges.col, np.full(len(exit_nodes), n)]), np.concatenate([edges.row, exit_nodes]))
+    ), shape=(n + 1, n + 1))
+    reachable = np.zeros(n + 1, dtype=bool)
+    reachable[breadth_first_order(augmented, n, directed=True, return_predecessors=False)] = True
+    transient = np.flatnonzero(~exits & reachable[:n])
+    l_end = end_nodes & l_nodes
+    r_end = end_nodes & ~l_nodes
+    to_transient = transition[transient]
+    # I - Q is solved iteratively: on scale-free graphs a sparse LU of it fills in and costs more than the walks.
+    matrix = (identity(len(transient), format="csr") - to_transient[:, transient]).tocsr()
+    preconditioner = diags(1 / matrix.diagonal())
+    h = np.zeros((n, 2))
+    h[l_end, 0] = 1
+    h[r_end, 1] = 1
+    if len(transient):
+        h[transient, 0] = solve(matrix, to_transient[:, l_end].sum(axis=1).A1, None, preconditioner, tol)
+        # Walkers that do not end on the left mostly end on the right, which makes a close first guess.
+        h[transient, 1] = solve(matrix, to_transient[:, r_end].sum(axis=1).A1, np.clip(1 - h[transient, 0], 0, 1), preconditioner, tol)
+    probabilities = h[starts].copy()
+    # A walk that starts on an end node only stops on a different end node, so returning to the start restarts it.
+    end_starts = np.flatnonzero(end_nodes[starts])
+    if not len(end_starts):
+        return probabilities
+    nodes = starts[end_starts]
+    if len(end_starts) > max_end_starts:
+        # Each of these needs a solve of its own, so above `max_end_starts` they are estimated from walks instead.
+        per_start = -(-walks // len(end_starts))
+        ends = random_walks(adjacency.indptr, adjacency.indices, np.repeat(nodes, per_start), end_nodes, max_steps, seed)
+        ends = ends.reshape(len(end_starts), per_start)
+        finished = ends >= 0
+        hit_l = finished & l_nodes[np.where(finished, ends, 0)]
+        probabilities[end_starts, 0] = hit_l.mean(axis=1)
+        probabilities[end_starts, 1] = (finished & ~hit_l).mean(axis=1)
+        return probabilities
+    step = transition @ h
+    self_loop = transition[nodes, nodes].A1
+    returned = np.zeros(len(nodes))
+    if len(transient):
+        from_nodes = transition[nodes][:, transient]
+        for position, node in enumerate(nodes.tolist()):
+            absorbed = solve(matrix, to_transient[:, [node]].toarray().ravel(), None, preconditioner, tol)
+            returned[position] = from_nodes[position].dot(absorbed)[0]
+    hit_l = step[nodes, 0] - (self_loop + returned) * l_end[nodes]
+    hit_r = step[nodes, 1] - (self_loop + returned) * r_end[nodes]
+    stay = self_loop + returned
+    finish = np.divide(1, 1 - stay, out=np.zeros(len(nodes)), where=stay < 1 - 1e-12)
+    probabilities[end_starts, 0] = hit_l * finish
+    probabilities[end_starts, 1] = hit_r * finish
+    return probabilities
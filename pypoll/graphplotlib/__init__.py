@@ -1 +1,5 @@
-from .graphplot import GraphPlot
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["GraphPlot"]
+__getattr__, __dir__ = lazy_module(__name__, {"GraphPlot": ".graphplot"})
@@ -1,12 +1,9 @@
 from http.server import SimpleHTTPRequestHandler
-import waitress
-import flask
-from flask import Flask
-from flask_cors import cross_origin
-from PyQt6.QtCore import *
-from PyQt6.QtWidgets import *
-from PyQt6.QtWebEngineWidgets import *
+from collections import OrderedDict
+from hashlib import sha1
 import socketserver
+import gzip
+import json
 import os
 import sys
 import subprocess
@@ -38,26 +35,143 @@ class TCPServer:
         self.httpd.shutdown()
 
 
-class Plot(QMainWindow):
-    def __init__(self, *args, **kwargs):
-        super(Plot, self).__init__(*args, **kwargs)
-        self.browser = QWebEngineView()
-        self.browser.setUrl(QUrl(f"http://localhost:{TCP_PORT}/"))
-        self.setCentralWidget(self.browser)
+def plot():
+    # PyQt6 is only needed by the viewer process started from `GraphPlot.show`.
+    from PyQt6.QtCore import QUrl
+    from PyQt6.QtWidgets import QApplication, QMainWindow
+    from PyQt6.QtWebEngineWidgets import QWebEngineView
+
+    class Plot(QMainWindow):
+        def __init__(self, *args, **kwargs):
+            super(Plot, self).__init__(*args, **kwargs)
+            self.browser = QWebEngineView()
+            self.browser.setUrl(QUrl(f"http://localhost:{TCP_PORT}/"))
+            self.setCentralWidget(self.browser)
+
+    app = QApplication(sys.argv)
+    window = Plot()
+    window.show()
+    app.exec()
 
 
 class FlaskServer:
-    def __init__(self, graph_file):
+    def __init__(self, graph_file, options=None):
+        import waitress
+        from flask import Flask
+        from pypoll.graphplotlib.lod import LevelOfDetail, read_layout
+        from pypoll.metricslib import metrics
+        if options is None:
+            options = dict()
         self.app = Flask(__name__)
         self.graph_file = graph_file
+        stat = os.stat(graph_file)
+        self.version = f"{graph_file}|{stat.st_mtime_ns}|{stat.st_size}"
+        print("Loading layout...")
+        with metrics.timer("plot.load"):
+            self.lod = LevelOfDetail(read_layout(graph_file), options)
+        self.cache_size = options.get("cache_size", 256)
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
         self.endpoints()
         self.server = waitress.create_server(self.app, port=FLASK_PORT)
 
+    def __body(self, key, build):
+        with self.lock:
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                return self.responses[key]
+        # Bodies are compressed once and kept, so panning back to a viewport costs neither a query nor a compression.
+        body = build()
+        if not isinstance(body, bytes):
+            body = gzip.compress(body.encode("utf8"), 6)
+        with self.lock:
+            self.responses[key] = body
+            while len(self.responses) > self.cache_size:
+                self.responses.popitem(last=False)
+        return body
+
+    def __respond(self, endpoint, build, mimetype):
+        from flask import Response, request
+        from pypoll.metricslib import metrics
+        key = request.path + "?" + "&".join(f"{name}={value}" for name, value in sorted(request.args.items()))
+        etag = sha1(f"{self.version}|{key}".encode("utf8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            with metrics.timer("plot.response", endpoint=endpoint):
+                body = self.__body(key, build)
+            if request.accept_encodings["gzip"]:
+                response = Response(body, mimetype=mimetype)
+                response.headers["Content-Encoding"] = "gzip"
+            else:
+                response = Response(gzip.decompress(body), mimetype=mimetype)
+        response.set_etag(etag)
+        # The browser keeps every response and revalidates it, which costs a 304 while the graph file is unchanged.
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    @staticmethod
+    def __bounds():
+        from flask import request
+        bounds = [request.args.get(name, type=float) for name in ("x0", "y0", "x1", "y1")]
+        if all(value is None for value in bounds):
+            return None
+        if any(value is None for value in bounds):
+            raise ValueError("A viewport needs `x0`, `y0`, `x1` and `y1`")
+        return bounds
+
+    def __graph(self):
+        # Small graphs are sent whole, larger ones as the heaviest part of the graph that the viewer can still draw.
+        if self.lod.summary()["nodes"] <= self.lod.max_nodes:
+            graph_file = open(self.graph_file, "rb")
+            body = graph_file.read()
+            graph_file.close()
+            return body if self.graph_file.endswith(".gz") else gzip.compress(body, 6)
+        return self.lod.gexf()
+
     def endpoints(self):
+        from flask import jsonify, request
+        from flask_cors import cross_origin
+
+        @self.app.errorhandler(ValueError)
+        def bad_request(error):
+            return jsonify({"error": str(error)}), 400
+
         @self.app.route("/")
-        @cross_origin()
+        @cross_origin(expose_headers=["ETag"])
         def hello_world():
-            return flask.send_file(self.graph_file)
+            return self.__respond("graph", self.__graph, "application/xml")
+
+        @self.app.route("/summary")
+        @cross_origin(expose_headers=["ETag"])
+        def summary():
+            return self.__respond("summary", lambda: json.dumps(self.lod.summary()), "application/json")
+
+        @self.app.route("/viewport")
+        @cross_origin(expose_headers=["ETag"])
+        def viewport():
+            bounds = self.__bounds()
+            max_nodes = request.args.get("max_nodes", type=int)
+            max_edges = request.args.get("max_edges", type=int)
+            return self.__respond("viewport", lambda: json.dumps(self.lod.viewport(bounds, max_nodes, max_edges)), "application/json")
+
+        @self.app.route("/clusters")
+        @cross_origin(expose_headers=["ETag"])
+        def clusters():
+            bounds = self.__bounds()
+            level = request.args.get("level", type=int)
+            if level is None:
+                level = self.lod.level(*bounds) if bounds is not None else 0
+            return self.__respond("clusters", lambda: json.dumps(self.lod.clusters(level, bounds)), "application/json")
+
+        @self.app.route("/gexf")
+        @cross_origin(expose_headers=["ETag"])
+        def gexf():
+            bounds = self.__bounds()
+            max_nodes = request.args.get("max_nodes", type=int)
+            max_edges = request.args.get("max_edges", type=int)
+            return self.__respond("gexf", lambda: self.lod.gexf(bounds, max_nodes, max_edges), "application/xml")
 
     def serve_forever(self):
         self.server.run()
@@ -70,9 +184,9 @@ class GraphPlot:
     def __init__(self):
         pass
 
-    def show(self, filename=None):
+    def show(self, filename=None, options=None):
         cwd = os.getcwd()
-        flask_server = FlaskServer(os.path.abspath(filename))
+        flask_server = FlaskServer(os.path.abspath(filename), options)
         serve = threading.Thread(target=flask_server.serve_forever)
         serve.daemon = True
         serve.start()
@@ -85,9 +199,17 @@ class GraphPlot:
         flask_server.shutdown()
         os.chdir(cwd)
 
+    @staticmethod
+    def render(filename, output, options=None):
+        # Headless: no display, viewer process or ports are needed.
+        from pypoll.graphplotlib.render import render
+        return render(filename, output, options)
+
+    @staticmethod
+    def render_many(jobs, options=None, workers=4):
+        from pypoll.graphplotlib.render import render_many
+        return render_many(jobs, options, workers)
+
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = Plot()
-    window.show()
-    app.exec()
+    plot()
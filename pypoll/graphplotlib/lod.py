@@ -0,0 +1,244 @@
+from pypoll.graphlib.gexf import dump_gexf
+from xml.etree.ElementTree import iterparse
+import numpy as np
+import gzip
+import io
+
+
+GREY = (210, 210, 210, 1.0)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_layout(filename):
+    file = gzip.open(filename, "rb") if filename.endswith(".gz") else open(filename, "rb")
+    ids = []
+    x, y, size, colors, follows = [], [], [], [], []
+    sources, targets, weights = [], [], []
+    attribute_class = None
+    follows_id = None
+    container = None
+    with file:
+        for event, element in iterparse(file, events=("start", "end")):
+            tag = _local(element.tag)
+            if event == "start":
+                if tag == "attributes":
+                    attribute_class = element.get("class")
+                elif tag in ("nodes", "edges"):
+                    container = element
+                continue
+            if tag == "attribute" and attribute_class == "node" and element.get("title") == "follows":
+                follows_id = element.get("id")
+            elif tag == "node":
+                node_size, position, color, label = 1.0, (0.0, 0.0), GREY, None
+                for child in element.iter():
+                    child_tag = _local(child.tag)
+                    if child_tag == "attvalue" and child.get("for") == follows_id:
+                        label = child.get("value")
+                    elif child_tag == "size":
+                        node_size = float(child.get("value"))
+                    elif child_tag == "position":
+                        position = (float(child.get("x")), float(child.get("y")))
+                    elif child_tag == "color":
+                        color = (int(child.get("r")), int(child.get("g")), int(child.get("b")), float(child.get("a", 1.0)))
+                ids.append(element.get("id"))
+                x.append(position[0])
+                y.append(position[1])
+                size.append(node_size)
+                colors.append(color)
+                follows.append(label)
+                # Parsed elements are dropped from the tree, so memory does not grow with the file.
+                container.clear()
+            elif tag == "edge":
+                sources.append(element.get("source"))
+                targets.append(element.get("target"))
+                weights.append(float(element.get("weight", 1.0)))
+                container.clear()
+    index = {node: position for position, node in enumerate(ids)}
+    return {
+        "ids": ids,
+        "x": np.array(x, dtype=np.float64),
+        "y": np.array(y, dtype=np.float64),
+        "size": np.array(size, dtype=np.float64),
+        "color": np.array(colors, dtype=np.float64).reshape(-1, 4),
+        "follows": follows,
+        "source": np.fromiter((index[node] for node in sources), dtype=np.int64, count=len(sources)),
+        "target": np.fromiter((index[node] for node in targets), dtype=np.int64, count=len(targets)),
+        "weight": np.array(weights, dtype=np.float64)
+    }
+
+
+class GridIndex:
+    def __init__(self, x, y, bounds, resolution=256):
+        self.x = x
+        self.y = y
+        self.bounds = bounds
+        self.resolution = resolution
+        column, row = self.cell(x, y)
+        cells = row * resolution + column
+        # Nodes are sorted by cell, so the cells of one grid row that fall in a viewport are one contiguous slice.
+        self.order = np.argsort(cells, kind="stable")
+        self.starts = np.searchsorted(cells[self.order], np.arange(resolution * resolution + 1))
+
+    def cell(self, x, y):
+        x0, y0, x1, y1 = self.bounds
+        column = np.floor((np.asarray(x) - x0) / max(x1 - x0, 1e-12) * self.resolution).astype(np.int64)
+        row = np.floor((np.asarray(y) - y0) / max(y1 - y0, 1e-12) * self.resolution).astype(np.int64)
+        return np.clip(column, 0, self.resolution - 1), np.clip(row, 0, self.resolution - 1)
+
+    def query(self, x0, y0, x1, y1):
+        (column0, column1), (row0, row1) = self.cell([x0, x1], [y0, y1])
+        slices = [
+            self.order[self.starts[row * self.resolution + column0]:self.starts[row * self.resolution + column1 + 1]]
+            for row in range(row0, row1 + 1)
+        ]
+        candidates = np.concatenate(slices) if len(slices) else np.zeros(0, dtype=np.int64)
+        x, y = self.x[candidates], self.y[candidates]
+        return candidates[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+
+class LevelOfDetail:
+    def __init__(self, layout, options=None):
+        if options is None:
+            options = dict()
+        self.layout = layout
+        self.max_nodes = options.get("max_nodes", 5000)
+        self.max_edges = options.get("max_edges", 20000)
+        self.levels = options.get("levels", 8)
+        x, y = layout["x"], layout["y"]
+        if len(x):
+            self.bounds = (float(x.min()), float(y.min()), float(x.max()), float(y.max()))
+        else:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+        self.grid = GridIndex(x, y, self.bounds, options.get("resolution", 256))
+        # Nodes with the most weighted connections are shown first when a viewport holds more than `max_nodes`.
+        number_of_nodes = len(x)
+        self.degree = (
+            np.bincount(layout["source"], layout["weight"], minlength=number_of_nodes) +
+            np.bincount(layout["target"], layout["weight"], minlength=number_of_nodes)
+        )
+        edge_order = np.argsort(-layout["weight"], kind="stable")
+        self.source = layout["source"][edge_order]
+        self.target = layout["target"][edge_order]
+        self.weight = layout["weight"][edge_order]
+        # Clusters group nodes by community, which is the `follows` label or, without it, the node color.
+        keys = [label if label is not None else tuple(color) for label, color in zip(layout["follows"], layout["color"].tolist())]
+        self.communities = dict()
+        self.community = np.fromiter((self.communities.setdefault(key, len(self.communities)) for key in keys), dtype=np.int64, count=len(keys))
+        self.clusters_by_level = dict()
+
+    def summary(self):
+        return {
+            "nodes": len(self.layout["ids"]),
+            "edges": len(self.weight),
+            "bounds": list(self.bounds),
+            "levels": self.levels,
+            "max_nodes": self.max_nodes,
+            "max_edges": self.max_edges
+        }
+
+    def level(self, x0, y0, x1, y1):
+        width = max(self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1], 1e-12)
+        viewport = max(x1 - x0, y1 - y0, 1e-12)
+        return int(np.clip(np.ceil(np.log2(width / viewport)), 0, self.levels))
+
+    def __nodes(self, indices):
+        layout = self.layout
+        return {
+            "id": [layout["ids"][index] for index in indices.tolist()],
+            "x": layout["x"][indices].tolist(),
+            "y": layout["y"][indices].tolist(),
+            "size": layout["size"][indices].tolist(),
+            "color": layout["color"][indices].tolist(),
+            "follows": [layout["follows"][index] for index in indices.tolist()]
+        }
+
+    def select(self, bounds=None, max_nodes=None, max_edges=None):
+        x0, y0, x1, y1 = bounds if bounds is not None else self.bounds
+        max_nodes = self.max_nodes if max_nodes is None else max_nodes
+        max_edges = self.max_edges if max_edges is None else max_edges
+        nodes = self.grid.query(x0, y0, x1, y1)
+        total = len(nodes)
+        if total > max_nodes:
+            nodes = nodes[np.argsort(-self.degree[nodes], kind="stable")[:max_nodes]]
+        nodes = np.sort(nodes)
+        visible = np.zeros(len(self.degree), dtype=bool)
+        visible[nodes] = True
+        # Edges are kept sorted by weight, so the first `max_edges` between visible nodes are the heaviest ones.
+        edges = np.flatnonzero(visible[self.source] & visible[self.target])[:max_edges]
+        return nodes, edges, total
+
+    def viewport(self, bounds=None, max_nodes=None, max_edges=None):
+        nodes, edges, total = self.select(bounds, max_nodes, max_edges)
+        bounds = bounds if bounds is not None else self.bounds
+        position = np.searchsorted(nodes, np.concatenate([self.source[edges], self.target[edges]]))
+        return {
+            "bounds": list(bounds),
+            "level": self.level(*bounds),
+            "total_nodes": total,
+            "nodes": self.__nodes(nodes),
+            # Edge endpoints are positions in `nodes`, which keeps the response small.
+            "edges": {
+                "source": position[:len(edges)].tolist(),
+                "target": position[len(edges):].tolist(),
+                "weight": self.weight[edges].tolist()
+            }
+        }
+
+    def __clusters(self, level):
+        if level not in self.clusters_by_level:
+            side = 2 ** level
+            x0, y0, x1, y1 = self.bounds
+            column = np.clip(np.floor((self.layout["x"] - x0) / max(x1 - x0, 1e-12) * side), 0, side - 1).astype(np.int64)
+            row = np.clip(np.floor((self.layout["y"] - y0) / max(y1 - y0, 1e-12) * side), 0, side - 1).astype(np.int64)
+            keys = (row * side + column) * max(len(self.communities), 1) + self.community
+            keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            count = np.bincount(inverse, minlength=len(keys))
+            self.clusters_by_level[level] = {
+                "x": np.bincount(inverse, self.layout["x"], len(keys)) / count,
+                "y": np.bincount(inverse, self.layout["y"], len(keys)) / count,
+                "count": count,
+                "size": np.bincount(inverse, self.layout["size"], len(keys)),
+                "weight": np.bincount(inverse, self.degree, len(keys)),
+                "node": first
+            }
+        return self.clusters_by_level[level]
+
+    def clusters(self, level, bounds=None):
+        level = int(np.clip(level, 0, self.levels))
+        clusters = self.__clusters(level)
+        x0, y0, x1, y1 = bounds if bounds is not None else self.bounds
+        selected = np.flatnonzero((clusters["x"] >= x0) & (clusters["x"] <= x1) & (clusters["y"] >= y0) & (clusters["y"] <= y1))
+        nodes = clusters["node"][selected]
+        return {
+            "level": level,
+            "bounds": [x0, y0, x1, y1],
+            "x": clusters["x"][selected].tolist(),
+            "y": clusters["y"][selected].tolist(),
+            "count": clusters["count"][selected].tolist(),
+            "size": clusters["size"][selected].tolist(),
+            "weight": clusters["weight"][selected].tolist(),
+            "color": self.layout["color"][nodes].tolist(),
+            "follows": [self.layout["follows"][node] for node in nodes.tolist()]
+        }
+
+    def gexf(self, bounds=None, max_nodes=None, max_edges=None):
+        nodes, edges, total = self.select(bounds, max_nodes, max_edges)
+        layout = self.layout
+        ids = layout["ids"]
+        has_follows = any(label is not None for label in layout["follows"])
+        attributes = [("follows", "string")] if has_follows else []
+        colors = [{"r": int(r), "g": int(g), "b": int(b), "a": a} for r, g, b, a in layout["color"][nodes].tolist()]
+        rows = (
+            (ids[node], [layout["follows"][node]] if has_follows else [], (layout["size"][node], layout["x"][node], layout["y"][node], color))
+            for node, color in zip(nodes.tolist(), colors)
+        )
+        edge_rows = (
+            (ids[source], ids[target], weight, [])
+            for source, target, weight in zip(self.source[edges].tolist(), self.target[edges].tolist(), self.weight[edges].tolist())
+        )
+        file = io.StringIO()
+        dump_gexf(file, attributes, rows, [], edge_rows)
+        return file.getvalue()
@@ -0,0 +1,177 @@
+from pypoll.graphplotlib.lod import read_layout
+from pypoll.metricslib import metrics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+import numpy as np
+import struct
+import zlib
+import os
+
+
+WHITE = {"r": 255, "g": 255, "b": 255}
+CHUNK_SAMPLES = 2 ** 22
+
+
+def downsample_edges(weight, max_edges=None, seed=None):
+    if max_edges is None or len(weight) <= max_edges:
+        return np.arange(len(weight))
+    if max_edges <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # Weighted sampling without replacement (Efraimidis-Spirakis): heavy edges are kept more often, light ones still appear.
+    random = np.random.default_rng(seed)
+    keys = np.log(random.random(len(weight))) / np.maximum(weight, 1e-12)
+    return np.sort(np.argpartition(-keys, max_edges - 1)[:max_edges])
+
+
+def _transform(layout, width, height, margin):
+    x, y = layout["x"], layout["y"]
+    if not len(x):
+        return x, y
+    x0, x1, y0, y1 = x.min(), x.max(), y.min(), y.max()
+    scale = min((width - 2 * margin) / max(x1 - x0, 1e-12), (height - 2 * margin) / max(y1 - y0, 1e-12))
+    px = (x - x0) * scale + (width - (x1 - x0) * scale) / 2
+    # Layout coordinates grow upwards, image rows grow downwards.
+    py = height - ((y - y0) * scale + (height - (y1 - y0) * scale) / 2)
+    return px, py
+
+
+def _prepare(layout, options):
+    width, height = options.get("width", 1920), options.get("height", 1080)
+    px, py = _transform(layout, width, height, options.get("margin", 20))
+    edges = downsample_edges(layout["weight"], options.get("max_edges", 200000), options.get("seed"))
+    source, target = layout["source"][edges], layout["target"][edges]
+    if "edge_color" in options:
+        color = options["edge_color"]
+        edge_color = np.tile(np.array([color["r"], color["g"], color["b"]], dtype=np.float64), (len(edges), 1))
+    else:
+        edge_color = layout["color"][source, :3]
+    radius = np.maximum(layout["size"] * options.get("node_scale", 1.0), 0.5)
+    return width, height, px, py, source, target, edge_color, radius
+
+
+def rasterize(layout, options=None):
+    if options is None:
+        options = dict()
+    width, height, px, py, source, target, edge_color, radius = _prepare(layout, options)
+    background = options.get("background", WHITE)
+    canvas = np.empty((height * width, 3), dtype=np.float64)
+    canvas[:] = [background["r"], background["g"], background["b"]]
+    # Edges are sampled once per pixel of their length and accumulated, so overlapping edges darken the way alpha blending would.
+    sx, sy, tx, ty = px[source], py[source], px[target], py[target]
+    length = np.ceil(np.hypot(tx - sx, ty - sy)).astype(np.int64) + 1
+    count = np.zeros(height * width, dtype=np.float64)
+    color_sum = np.zeros((height * width, 3), dtype=np.float64)
+    ends = np.cumsum(length)
+    boundaries = np.searchsorted(ends, np.arange(CHUNK_SAMPLES, ends[-1] if len(ends) else 0, CHUNK_SAMPLES))
+    for start, end in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(length)]])):
+        if start >= end:
+            continue
+        chunk_length = length[start:end]
+        edge = np.repeat(np.arange(start, end), chunk_length)
+        offsets = np.arange(len(edge)) - np.repeat(np.cumsum(chunk_length) - chunk_length, chunk_length)
+        t = offsets / np.maximum(length[edge] - 1, 1)
+        xs = np.rint(sx[edge] + t * (tx[edge] - sx[edge])).astype(np.int64)
+        ys = np.rint(sy[edge] + t * (ty[edge] - sy[edge])).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        pixels, edge = ys[inside] * width + xs[inside], edge[inside]
+        count += np.bincount(pixels, minlength=height * width)
+        for channel in range(3):
+            color_sum[:, channel] += np.bincount(pixels, edge_color[edge, channel], minlength=height * width)
+    drawn = count > 0
+    alpha = 1 - (1 - options.get("edge_alpha", 0.1)) ** count[drawn]
+    canvas[drawn] = canvas[drawn] * (1 - alpha[:, None]) + color_sum[drawn] / count[drawn, None] * alpha[:, None]
+    # Nodes are stamped as disks, one stencil per distinct radius.
+    rounded = np.rint(radius * 2) / 2
+    for node_radius in np.unique(rounded):
+        nodes = np.flatnonzero(rounded == node_radius)
+        extent = int(np.ceil(node_radius))
+        dy, dx = np.mgrid[-extent:extent + 1, -extent:extent + 1]
+        disk = dx ** 2 + dy ** 2 <= node_radius ** 2
+        dx, dy = dx[disk], dy[disk]
+        xs = (np.rint(px[nodes])[:, None] + dx).astype(np.int64).ravel()
+        ys = (np.rint(py[nodes])[:, None] + dy).astype(np.int64).ravel()
+        node = np.repeat(nodes, len(dx))
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        pixels, node = ys[inside] * width + xs[inside], node[inside]
+        color = layout["color"][node]
+        canvas[pixels] = canvas[pixels] * (1 - color[:, 3:]) + color[:, :3] * color[:, 3:]
+    return np.clip(np.rint(canvas), 0, 255).astype(np.uint8).reshape(height, width, 3)
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(image, level=6):
+    height, width, _ = image.shape
+    # Every scanline starts with filter type 0 (none).
+    scanlines = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)], axis=1)
+    return (
+        b"\x89PNG\r\n\x1a\n" +
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+        _chunk(b"IDAT", zlib.compress(scanlines.tobytes(), level)) +
+        _chunk(b"IEND", b"")
+    )
+
+
+def _rgb(color):
+    return f"rgb({int(color[0])},{int(color[1])},{int(color[2])})"
+
+
+def encode_svg(layout, options=None):
+    if options is None:
+        options = dict()
+    width, height, px, py, source, target, edge_color, radius = _prepare(layout, options)
+    background = options.get("background", WHITE)
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n',
+        f'<rect width="{width}" height="{height}" fill="{_rgb((background["r"], background["g"], background["b"]))}" />\n',
+        f'<g stroke-width="{options.get("edge_width", 0.5)}" stroke-opacity="{options.get("edge_alpha", 0.1)}" fill="none">\n'
+    ]
+    lines.extend(
+        f'<line x1="{x1:.2f}" y1="{y1:.2f}" x2="{x2:.2f}" y2="{y2:.2f}" stroke="{_rgb(color)}" />\n'
+        for x1, y1, x2, y2, color in zip(px[source].tolist(), py[source].tolist(), px[target].tolist(), py[target].tolist(), edge_color.tolist())
+    )
+    lines.append("</g>\n<g>\n")
+    lines.extend(
+        f'<circle cx="{x:.2f}" cy="{y:.2f}" r="{r:.2f}" fill="{_rgb(color)}" fill-opacity="{color[3]}" />\n'
+        for x, y, r, color in zip(px.tolist(), py.tolist(), radius.tolist(), layout["color"].tolist())
+    )
+    lines.append("</g>\n</svg>\n")
+    return "".join(lines).encode("utf8")
+
+
+def render(filename, output, options=None):
+    if options is None:
+        options = dict()
+    filetype = output.rsplit(".", 1)[-1].lower()
+    if filetype not in ("png", "svg"):
+        raise Exception("The file must be png or svg type")
+    layout = read_layout(filename) if isinstance(filename, str) else filename
+    with metrics.timer("plot.render", format=filetype):
+        if filetype == "png":
+            data = encode_png(rasterize(layout, options), options.get("compression_level", 6))
+        else:
+            data = encode_svg(layout, options)
+    # Written next to the output and renamed, so a batch that is interrupted never leaves half an image behind.
+    part = os.path.join(os.path.dirname(output), f".{os.path.basename(output)}.part")
+    output_file = open(part, "wb")
+    output_file.write(data)
+    output_file.close()
+    os.replace(part, output)
+    return output
+
+
+def render_many(jobs, options=None, workers=4):
+    results = dict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render, filename, output, options): output for filename, output in jobs}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            output = futures[future]
+            try:
+                future.result()
+                results[output] = None
+            except Exception as error:
+                print(f"Failed to render `{output}`: {error}")
+                results[output] = str(error)
+    return results
@@ -0,0 +1,2 @@
+from .metrics import Metrics, metrics
+from .sinks import Sink, LoggingSink, JsonLinesSink, PrometheusSink
@@ -0,0 +1,97 @@
+from time import perf_counter, time
+import threading
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+        self.started = None
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.key, perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        # Disabled by default: `count` and `timer` return before touching any state.
+        self.enabled = False
+        self.sinks = []
+        self.counters = dict()
+        self.timers = dict()
+        self.lock = threading.Lock()
+
+    def enable(self, *sinks):
+        self.sinks.extend(sinks)
+        self.enabled = True
+
+    def disable(self):
+        self.flush()
+        self.enabled = False
+        self.sinks = []
+
+    def reset(self):
+        with self.lock:
+            self.counters = dict()
+            self.timers = dict()
+
+    @staticmethod
+    def __key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self.__key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, self.__key(name, labels))
+
+    def observe(self, key, seconds):
+        with self.lock:
+            count, total, maximum = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (count + 1, total + seconds, max(maximum, seconds))
+        event = {"type": "timer", "name": key[0], "labels": dict(key[1]), "seconds": seconds, "time": time()}
+        for sink in self.sinks:
+            sink.record(event)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "time": time(),
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+                "timers": [
+                    {"name": name, "labels": dict(labels), "count": count, "total": total, "max": maximum}
+                    for (name, labels), (count, total, maximum) in self.timers.items()
+                ]
+            }
+
+    def flush(self):
+        if not len(self.sinks):
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.flush(snapshot)
+
+
+metrics = Metrics()
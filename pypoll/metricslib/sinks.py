@@ -0,0 +1,92 @@
+import logging
+import json
+import os
+import re
+
+
+class Sink:
+    def record(self, event):
+        pass
+
+    def flush(self, snapshot):
+        pass
+
+
+class LoggingSink(Sink):
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("pypoll")
+        self.level = level
+
+    @staticmethod
+    def __labels(labels):
+        if not len(labels):
+            return ""
+        return "{" + ", ".join(f"{key}={value}" for key, value in labels.items()) + "}"
+
+    def record(self, event):
+        self.logger.log(self.level, "%s%s took %.3fs", event["name"], self.__labels(event["labels"]), event["seconds"])
+
+    def flush(self, snapshot):
+        for counter in snapshot["counters"]:
+            self.logger.log(self.level, "%s%s = %s", counter["name"], self.__labels(counter["labels"]), counter["value"])
+        for timer in snapshot["timers"]:
+            self.logger.log(
+                self.level, "%s%s: %d calls, %.3fs total, %.3fs max",
+                timer["name"], self.__labels(timer["labels"]), timer["count"], timer["total"], timer["max"]
+            )
+
+
+class JsonLinesSink(Sink):
+    def __init__(self, filename):
+        self.file = open(filename, "a", encoding="utf8")
+
+    def record(self, event):
+        self.file.write(json.dumps(event, default=str) + "\n")
+
+    def flush(self, snapshot):
+        self.file.write(json.dumps({"type": "snapshot", **snapshot}, default=str) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class PrometheusSink(Sink):
+    def __init__(self, filename, prefix="pypoll"):
+        self.filename = filename
+        self.prefix = prefix
+
+    def __name(self, name):
+        return re.sub(r"[^a-zA-Z0-9_]", "_", f"{self.prefix}_{name}")
+
+    @staticmethod
+    def __labels(labels):
+        if not len(labels):
+            return ""
+        values = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels.items()]
+        return "{" + ",".join(f'{key}="{value}"' for key, value in values) + "}"
+
+    def render(self, snapshot):
+        lines = []
+        declared = set()
+        for counter in snapshot["counters"]:
+            name = self.__name(counter["name"]) + "_total"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self.__labels(counter['labels'])} {counter['value']}")
+        for timer in snapshot["timers"]:
+            name = self.__name(timer["name"]) + "_seconds"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} summary")
+            lines.append(f"{name}_count{self.__labels(timer['labels'])} {timer['count']}")
+            lines.append(f"{name}_sum{self.__labels(timer['labels'])} {timer['total']}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self, snapshot):
+        # Replaced atomically, so a collector scraping the text file never reads half of it.
+        text_file = open(f"{self.filename}.tmp", "w", encoding="utf8")
+        text_file.write(self.render(snapshot))
+        text_file.close()
+        os.replace(f"{self.filename}.tmp", self.filename)
@@ -1 +1,5 @@
-from .sdk import SDK
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["SDK", "ResponseCache"]
+__getattr__, __dir__ = lazy_module(__name__, {"SDK": ".sdk", "ResponseCache": ".cache"})
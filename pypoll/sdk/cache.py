@@ -0,0 +1,65 @@
+from hashlib import sha256
+import threading
+import json
+import os
+
+
+class ResponseCache:
+    def __init__(self, directory, max_size=256 * 2 ** 20):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, authorization=None, body=None):
+        # Listings depend on who asks for them and on the page requested, not only on the URL.
+        return sha256(json.dumps([url, authorization, body], sort_keys=True).encode("utf8")).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            entry_file = open(self.__path(key), "r", encoding="utf8")
+        except FileNotFoundError:
+            return None
+        with entry_file:
+            try:
+                entry = json.load(entry_file)
+            except ValueError:
+                return None
+        # The modification time doubles as the last access time used for eviction.
+        try:
+            os.utime(self.__path(key))
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def put(self, key, etag, last_modified, content):
+        entry = {"etag": etag, "last_modified": last_modified, "content": content}
+        with self.lock:
+            entry_file = open(f"{self.__path(key)}.tmp", "w", encoding="utf8")
+            json.dump(entry, entry_file, ensure_ascii=False)
+            entry_file.close()
+            os.replace(f"{self.__path(key)}.tmp", self.__path(key))
+            self.__evict()
+
+    def __evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            size -= entry_size
+
+    def clear(self):
+        with self.lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
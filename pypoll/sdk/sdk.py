@@ -1,47 +1,78 @@
-from urllib.parse import urlparse
-from http.client import HTTPConnection, HTTPSConnection
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pypoll.sdk.cache import ResponseCache
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from tabulate import tabulate
+from uuid import uuid4
 import requests
 import json
+import math
+import zlib
+import os
+
+
+CHUNK_SIZE = 1 << 16
 
 
 class SDK:
-    def __init__(self, host):
-        if self.__check_https_url(host):
+    def __init__(self, host, timeout=(3.05, 60), retries=3, backoff_factor=0.5, pool_size=10, cache_dir=None, cache_size=256 * 2 ** 20):
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir, cache_size) if cache_dir is not None else None
+        # One pooled session keeps connections alive between calls; idempotent requests are retried with backoff.
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["HEAD", "GET", "OPTIONS"]),
+            # The last response is returned, so its status and message reach the same checks as without retries.
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if host.startswith("https://") or host.startswith("http://"):
+            self.host = host.rstrip("/")
+        elif self.__check_url(f'https://{host}'):
             self.host = f'https://{host}'
-        elif self.__check_http_url(host):
+        elif self.__check_url(f'http://{host}'):
             self.host = f'http://{host}'
         else:
             raise Exception("Both HTTP and HTTPS did not load the website, check whether your url is malformed.")
+        # Deleting a graph is a GET that is not idempotent, the most specific mount wins and never replays it.
+        self.session.mount(f"{self.host}/graph/delete/", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
         self.bearer_token = None
 
-    @staticmethod
-    def __check_https_url(host):
-        HTTPS_URL = f'https://{host}'
+    def __check_url(self, url):
+        connect_timeout = self.timeout[0] if type(self.timeout) == tuple else self.timeout
         try:
-            HTTPS_URL = urlparse(HTTPS_URL)
-            connection = HTTPSConnection(HTTPS_URL.netloc, timeout=0.01)
-            connection.request('HEAD', HTTPS_URL.path)
-            if connection.getresponse():
-                return True
-            else:
-                return False
-        except:
+            self.session.head(url, timeout=connect_timeout)
+            return True
+        except requests.exceptions.RequestException:
             return False
 
-    @staticmethod
-    def __check_http_url(host):
-        HTTP_URL = f'http://{host}'
-        try:
-            HTTP_URL = urlparse(HTTP_URL)
-            connection = HTTPConnection(HTTP_URL.netloc, timeout=0.01)
-            connection.request('HEAD', HTTP_URL.path)
-            if connection.getresponse():
-                return True
-            else:
-                return False
-        except:
-            return False
+    def __request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, f"{self.host}{path}", **kwargs)
+
+    def __get(self, path, headers=None, body=None):
+        # Cached responses are revalidated with `If-None-Match`/`If-Modified-Since`, a 304 reuses the stored content.
+        headers = dict(headers or {})
+        if self.cache is None:
+            res = self.__request("GET", path, headers=headers, json=body)
+            return res.status_code, res.text
+        key = self.cache.key(f"{self.host}{path}", headers.get("Authorization"), body)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry["etag"] is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        res = self.__request("GET", path, headers=headers, json=body)
+        if res.status_code == 304 and entry is not None:
+            return 200, entry["content"]
+        if res.status_code == 200 and ("ETag" in res.headers or "Last-Modified" in res.headers):
+            self.cache.put(key, res.headers.get("ETag"), res.headers.get("Last-Modified"), res.text)
+        return res.status_code, res.text
 
     def sign_up(self, email, password, first_name, last_name):
         body = {
@@ -50,7 +81,7 @@ class SDK:
             "first_name": first_name,
             "last_name": last_name
         }
-        res = requests.post(f"{self.host}/auth/signup", json=body)
+        res = self.__request("POST", "/auth/signup", json=body)
         print(res.text)
 
     def sign_in(self, email, password):
@@ -58,7 +89,7 @@ class SDK:
             "email": email,
             "password": password
         }
-        res = requests.post(f"{self.host}/auth/signin", json=body)
+        res = self.__request("POST", "/auth/signin", json=body)
         if res.status_code == 200:
             self.bearer_token = f"Bearer {res.json()['access_token']}"
         else:
@@ -68,79 +99,148 @@ class SDK:
         headers = {
             "Authorization": self.bearer_token
         }
-        res = requests.get(f"{self.host}/user/get", headers=headers)
+        res = self.__request("GET", "/user/get", headers=headers)
         if res.status_code == 200:
             print(res.json())
         else:
             print(res.status_code, res.text)
 
-    def get_all_graphs(self, page=0, items_per_page=10):
+    def __get_page(self, page, items_per_page):
         headers = {
             "Authorization": self.bearer_token
         }
-        count = requests.get(f"{self.host}/graph/count", headers=headers)
-        if items_per_page == "all":
-            page = 0
-            items_per_page = count.json()["number_of_graphs"]
         body = {
             "page": page,
             "items": items_per_page
         }
-        res = requests.get(f"{self.host}/graph/get/all", headers=headers, json=body)
-        if res.status_code == 200:
-            data = {
-                "Id": [],
-                "Filename": [],
-                "Description": [],
-                "Source": [],
-                "Graph nodes": [],
-                "Graph edges": [],
-                "Uploaded date": []
-            }
-            for item in res.json()["data"]:
-                data["Id"].append(item["_id"])
-                data["Filename"].append(item["filename"])
-                data["Description"].append(item["description"])
-                data["Source"].append(item["source"])
-                data["Graph nodes"].append(item["graph_properties"]["nodes"])
-                data["Graph edges"].append(item["graph_properties"]["edges"])
-                data["Uploaded date"].append(item["uploadDate"])
-            print(tabulate(data, headers="keys"))
-        else:
-            print(res.status_code, res.text)
+        status_code, text = self.__get("/graph/get/all", headers, body)
+        if status_code != 200:
+            raise Exception(f"{status_code} {text}")
+        return json.loads(text)["data"]
+
+    def count_graphs(self):
+        headers = {
+            "Authorization": self.bearer_token
+        }
+        status_code, text = self.__get("/graph/count", headers)
+        if status_code != 200:
+            raise Exception(f"{status_code} {text}")
+        return json.loads(text)["number_of_graphs"]
+
+    def iter_graphs(self, items_per_page=100, prefetch=4):
+        # Pages are requested ahead of the consumer, at most `prefetch` at a time, and yielded in order.
+        pages = math.ceil(self.count_graphs() / items_per_page)
+        with ThreadPoolExecutor(prefetch) as executor:
+            futures = deque()
+            for page in range(pages):
+                futures.append(executor.submit(self.__get_page, page, items_per_page))
+                if len(futures) >= prefetch:
+                    yield from futures.popleft().result()
+            while len(futures):
+                yield from futures.popleft().result()
+
+    def get_all_graphs(self, page=0, items_per_page=10):
+        if items_per_page == "all":
+            return list(self.iter_graphs())
+        return self.__get_page(page, items_per_page)
+
+    @staticmethod
+    def print_graphs(graphs):
+        data = {
+            "Id": [],
+            "Filename": [],
+            "Description": [],
+            "Source": [],
+            "Graph nodes": [],
+            "Graph edges": [],
+            "Uploaded date": []
+        }
+        for item in graphs:
+            data["Id"].append(item["_id"])
+            data["Filename"].append(item["filename"])
+            data["Description"].append(item["description"])
+            data["Source"].append(item["source"])
+            data["Graph nodes"].append(item["graph_properties"]["nodes"])
+            data["Graph edges"].append(item["graph_properties"]["edges"])
+            data["Uploaded date"].append(item["uploadDate"])
+        print(tabulate(data, headers="keys"))
 
     def get_graph(self, graph_id):
-        res = requests.get(f"{self.host}/graph/get/{graph_id}")
-        if res.status_code == 200:
-            print(res.json())
-        else:
-            print(res.status_code, res.text)
+        status_code, text = self.__get(f"/graph/get/{graph_id}")
+        if status_code != 200:
+            raise Exception(f"{status_code} {text}")
+        return json.loads(text)
 
     def delete_graph(self, graph_id):
         headers = {
             "Authorization": self.bearer_token
         }
-        res = requests.get(f"{self.host}/graph/delete/{graph_id}", headers=headers)
+        res = self.__request("GET", f"/graph/delete/{graph_id}", headers=headers)
         if res.status_code == 200:
             print(res.json())
         else:
             print(res.status_code, res.text)
 
-    def upload_graph(self, filename):
-        headers = {
-            "Authorization": self.bearer_token
-        }
-        files = {
-            "file": open(filename, "rb")
-        }
+    @staticmethod
+    def __multipart(filename, boundary):
+        yield (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(filename)}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf8")
+        graph_file = open(filename, "rb")
+        with graph_file:
+            while True:
+                chunk = graph_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode("utf8")
+
+    @staticmethod
+    def __gzip(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def __upload(self, filename, compress=False):
         metadata_filename = filename.split(".")
         metadata_filename[-1] = "metadata.json"
         metadata_file = open(".".join(metadata_filename), "r", encoding="utf8")
         body = json.load(metadata_file)
+        metadata_file.close()
         for key in body:
             body[key] = str(body[key])
-        res = requests.post(f"{self.host}/graph/upload", files=files, params=body, headers=headers)
+        # The multipart body is streamed from the file in chunks, so graphs are never loaded in memory to be sent.
+        boundary = uuid4().hex
+        headers = {
+            "Authorization": self.bearer_token,
+            "Content-Type": f"multipart/form-data; boundary={boundary}"
+        }
+        data = self.__multipart(filename, boundary)
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+            data = self.__gzip(data)
+        return self.__request("POST", "/graph/upload", data=data, params=body, headers=headers)
+
+    def upload_graph(self, filename, compress=False):
+        res = self.__upload(filename, compress)
         if res.status_code == 200:
             print(res.json())
         else:
             print(res.status_code, res.text)
+
+    def upload_graphs(self, filenames, workers=4, compress=False):
+        # `compress` gzips the request bodies, only for servers that accept `Content-Encoding: gzip` uploads.
+        def upload(filename):
+            try:
+                res = self.__upload(filename, compress)
+            except requests.exceptions.RequestException as e:
+                return {"filename": filename, "status_code": None, "response": str(e)}
+            if res.status_code == 200:
+                return {"filename": filename, "status_code": res.status_code, "response": res.json()}
+            return {"filename": filename, "status_code": res.status_code, "response": res.text}
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(upload, filenames))
@@ -1 +1,5 @@
-from .twitter import Twitter
+from pypoll._lazy import lazy_module
+
+
+__all__ = ["Twitter"]
+__getattr__, __dir__ = lazy_module(__name__, {"Twitter": ".twitter"})
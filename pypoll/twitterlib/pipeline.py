@@ -0,0 +1,44 @@
+import threading
+import queue
+
+
+STOP = object()
+
+
+class Stage(threading.Thread):
+    def __init__(self, function, output=None, queue_size=8):
+        super().__init__(daemon=True)
+        self.function = function
+        self.output = output
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is STOP:
+                break
+            # After a failure the stage keeps draining its queue so that upstream stages never block on it.
+            if self.error is None:
+                try:
+                    result = self.function(item)
+                    if self.output is not None:
+                        self.output.put(result)
+                except Exception as e:
+                    self.error = e
+        if self.output is not None:
+            self.output.close()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+        if self.output is not None:
+            self.output.check()
+
+    def put(self, item):
+        self.check()
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(STOP)
+        self.join()
@@ -0,0 +1,103 @@
+from time import monotonic, sleep, time
+import random
+from pypoll.metricslib import metrics
+import requests
+import threading
+import tweepy
+
+
+class RateLimiter:
+    def __init__(self, requests, period, min_interval=0.0, name=None):
+        self.capacity = requests
+        self.rate = requests / period
+        self.min_interval = min_interval
+        self.name = name
+        self.tokens = float(requests)
+        self.updated = monotonic()
+        self.last = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = max(0.0, (1 - self.tokens) / self.rate)
+                if self.last is not None:
+                    wait = max(wait, self.last + self.min_interval - now)
+                if wait <= 0:
+                    self.tokens -= 1
+                    self.last = now
+                    return
+            metrics.count("ratelimit.sleeps", endpoint=self.name)
+            metrics.count("ratelimit.sleep_seconds", wait, endpoint=self.name)
+            sleep(wait)
+
+
+# Requests per 15 minute window of the Twitter API v2 endpoints used by `Twitter`, with the minimum spacing between two
+# full-archive search requests.
+ENDPOINT_LIMITS = {
+    "get_user": (300, 15 * 60, 0.0),
+    "get_users_followers": (15, 15 * 60, 0.0),
+    "search_all_tweets": (300, 15 * 60, 1.0),
+    "get_all_tweets_count": (300, 15 * 60, 0.0)
+}
+
+
+# Server errors and dropped connections are retried up to `max_attempts` times. Rate limits are waited out separately,
+# anything else, e.g. an unknown username, is raised.
+RETRYABLE_ERRORS = (tweepy.TwitterServerError, requests.ConnectionError)
+
+
+def backoff(attempt, base=1.0, cap=300.0):
+    # Full jitter: a uniform wait up to an exponentially growing ceiling, so that retrying workers spread out.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def reset_wait(error, attempt):
+    # Twitter sends the end of the exhausted window as a unix timestamp. Without it, fall back to backoff.
+    reset = error.response.headers.get("x-rate-limit-reset") if error.response is not None else None
+    if reset is None:
+        return backoff(attempt, cap=15 * 60)
+    return max(0.0, int(reset) - time()) + 1
+
+
+class Scheduler:
+    def __init__(self, limits=None, max_attempts=8):
+        if limits is None:
+            limits = ENDPOINT_LIMITS
+        self.max_attempts = max_attempts
+        self.limiters = {endpoint: RateLimiter(*limit, name=endpoint) for endpoint, limit in limits.items()}
+
+    def acquire(self, endpoint):
+        if endpoint in self.limiters:
+            self.limiters[endpoint].acquire()
+
+    def call(self, endpoint, function, *args, **kwargs):
+        attempt = 0
+        limited = 0
+        while True:
+            self.acquire(endpoint)
+            try:
+                with metrics.timer("twitter.request", endpoint=endpoint):
+                    res = function(*args, **kwargs)
+                metrics.count("twitter.pages", endpoint=endpoint)
+                return res
+            except tweepy.TooManyRequests as e:
+                # An exhausted quota is not a failure, e.g. a resumed run whose window was spent by the previous one.
+                wait = reset_wait(e, limited)
+                limited += 1
+                metrics.count("ratelimit.sleeps", endpoint=endpoint)
+                metrics.count("ratelimit.sleep_seconds", wait, endpoint=endpoint)
+                print(f"Rate limit exceeded. Sleeping for {wait:.1f}sec ...")
+                sleep(wait)
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise
+                wait = backoff(attempt - 1)
+                metrics.count("twitter.retries", endpoint=endpoint)
+                metrics.count("twitter.backoff_seconds", wait, endpoint=endpoint)
+                print(f"Server error. {e} Sleeping for {wait:.1f}sec ...")
+                sleep(wait)
@@ -1,25 +1,32 @@
 import tweepy
-from time import sleep
-from pypoll.dblib import MongoDB
-from datetime import timedelta
+from pypoll.dblib import Backend
+from pypoll.twitterlib.pipeline import Stage
+from pypoll.twitterlib.ratelimit import Scheduler
+from pypoll.metricslib import metrics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import json
 
 
 class Twitter:
-    def __init__(self, bearer_token, mongodb):
+    def __init__(self, bearer_token, mongodb, scheduler=None):
         if bearer_token is None:
             raise Exception("Bearer token is none")
-        if type(mongodb) != MongoDB:
-            raise Exception("The DB must be MongoDB")
-        self.client = tweepy.Client(bearer_token=bearer_token, wait_on_rate_limit=True)
-        self.mongodb: MongoDB = mongodb
+        if not isinstance(mongodb, Backend):
+            raise Exception("The DB must be a storage backend, e.g. MongoDB or ParquetStore")
+        # The scheduler handles rate limits, so tweepy must not sleep on 429 responses as well.
+        self.client = tweepy.Client(bearer_token=bearer_token, wait_on_rate_limit=False)
+        self.mongodb: Backend = mongodb
+        # Shared by every thread of this client, so concurrent collections stay within the endpoint rate limits.
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
 
     def get_followers(self, username):
         if username is None or username == "":
             raise Exception("Handle cannot be none or empty")
         print(f"Fetching {username} ...")
-        self.mongodb.create_index(username)
+        self.mongodb.ensure_indexes(username, "followers", wait=True)
         print(f"`{username}` collection created.")
-        user = dict(self.client.get_user(username=username, user_fields=["id", "name"]).data)
+        user = dict(self.scheduler.call("get_user", self.client.get_user, username=username, user_fields=["id", "name"]).data)
         print(f"{user}\nGetting followers of {user['name']} ...")
         params = {
             "id": user["id"],
@@ -39,18 +46,13 @@ class Twitter:
                 print(f"Please delete the collections and start over if you want to update them.")
                 return
         while True:
-            try:
-                if cursor is None:
-                    if "pagination_token" in params:
-                        del params["pagination_token"]
-                else:
-                    params["pagination_token"] = cursor
-                res = self.client.get_users_followers(**params)
-                print(res)
-            except Exception as e:
-                print(f"Server error. {e} Sleeping for 10sec ...")
-                sleep(10)
-                continue
+            if cursor is None:
+                if "pagination_token" in params:
+                    del params["pagination_token"]
+            else:
+                params["pagination_token"] = cursor
+            res = self.scheduler.call("get_users_followers", self.client.get_users_followers, **params)
+            metrics.count("twitter.results", len(res.data or []), endpoint="get_users_followers")
             documents = []
             for item in res.data:
                 documents.append(dict(item))
@@ -64,23 +66,13 @@ class Twitter:
                 self.mongodb.update_metadata(username, str(cursor), None)
                 break
 
-    def get_tweets_by_hashtag(self, hashtag, start_time=None, end_time=None):
-        params = {
-            "tweet_fields": [
-                "id", "text", "attachments", "author_id", "context_annotations", "conversation_id",
-                "created_at", "entities", "geo", "in_reply_to_user_id", "lang", "public_metrics",
-                "referenced_tweets", "reply_settings", "source", "withheld"
-            ],
-           "expansions": ["author_id"],
-            "user_fields": [
-                "id", "name", "username", "created_at", "description",
-                "entities", "location",
-                "pinned_tweet_id", "profile_image_url", "protected",
-                "public_metrics", "url",
-                "verified", "withheld"
-            ],
-          "max_results": 100
-        }
+    def get_followers_batch(self, usernames, workers=4):
+        # Each account resumes from its own `metadata` cursor, the scheduler spaces the requests of all of them.
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(self.get_followers, usernames))
+
+    def get_tweets_by_hashtag(self, hashtag, start_time=None, end_time=None, pipelined=False):
+        params = self.__search_params()
         if hashtag is None or type(hashtag) != str:
             raise Exception("Hashtag cannot be none and must be a string")
         elif not hashtag.startswith("#"):
@@ -97,31 +89,53 @@ class Twitter:
             params["start_time"] = start_time
         if end_time is not None:
             params["end_time"] = end_time
-        cursor = None
-        while True:
+        if pipelined:
+            # Pages are fetched here while a transform stage and a bulk writer stage work through bounded queues.
+            # Tweet ids are unique in hashtag collections, so pages that overlap stored tweets only add the new ones.
+            writer = Stage(lambda documents: self.mongodb.insert_new(hashtag, documents))
+            transformer = Stage(self.__tweet_documents, writer)
+            writer.start()
+            transformer.start()
             try:
-                if cursor is None:
-                    if "next_token" in params:
-                        del params["next_token"]
-                else:
-                    params["next_token"] = cursor
-                res = self.client.search_all_tweets(hashtag, **params)
-                print(res)
-            except Exception as e:
-                print(f"Server error. {e} Sleeping for 10sec ...")
-                sleep(10)
-                continue
-            documents = []
-            for item in res.data:
-                documents.append(dict(item))
-                documents[-1]["id"] = str(documents[-1]["id"])
-                documents[-1]["conversation_id"] = str(documents[-1]["conversation_id"])
-                documents[-1]["author_id"] = str(documents[-1]["author_id"])
-                for user in res.includes["users"]:
-                    if documents[-1]["author_id"] == str(dict(user)["id"]):
-                        documents[-1]["author"] = dict(user)
-                        documents[-1]["author"]["id"] = str(documents[-1]["author"]["id"])
-            self.mongodb.insert_many(hashtag, documents)
+                for res in self.__search_pages(hashtag, params):
+                    transformer.put(res)
+            finally:
+                transformer.close()
+                writer.join()
+            transformer.check()
+        else:
+            for res in self.__search_pages(hashtag, params):
+                self.mongodb.insert_new(hashtag, self.__tweet_documents(res))
+
+    @staticmethod
+    def __search_params():
+        return {
+            "tweet_fields": [
+                "id", "text", "attachments", "author_id", "context_annotations", "conversation_id",
+                "created_at", "entities", "geo", "in_reply_to_user_id", "lang", "public_metrics",
+                "referenced_tweets", "reply_settings", "source", "withheld"
+            ],
+            "expansions": ["author_id"],
+            "user_fields": [
+                "id", "name", "username", "created_at", "description",
+                "entities", "location",
+                "pinned_tweet_id", "profile_image_url", "protected",
+                "public_metrics", "url",
+                "verified", "withheld"
+            ],
+            "max_results": 100
+        }
+
+    def __search_pages(self, hashtag, params, cursor=None):
+        while True:
+            if cursor is None:
+                if "next_token" in params:
+                    del params["next_token"]
+            else:
+                params["next_token"] = cursor
+            res = self.scheduler.call("search_all_tweets", self.client.search_all_tweets, hashtag, **params)
+            metrics.count("twitter.results", len(res.data or []), endpoint="search_all_tweets")
+            yield res
             meta = dict(res.meta)
             if "next_token" in meta:
                 # self.mongodb.update_metadata(hashtag, str(cursor), str(meta["next_token"]))
@@ -129,6 +143,23 @@ class Twitter:
             else:
                 break
 
+    @staticmethod
+    def __tweet_documents(res):
+        authors = dict()
+        for user in res.includes.get("users", []):
+            author = dict(user)
+            author["id"] = str(author["id"])
+            authors[author["id"]] = author
+        documents = []
+        for item in res.data or []:
+            documents.append(dict(item))
+            documents[-1]["id"] = str(documents[-1]["id"])
+            documents[-1]["conversation_id"] = str(documents[-1]["conversation_id"])
+            documents[-1]["author_id"] = str(documents[-1]["author_id"])
+            if documents[-1]["author_id"] in authors:
+                documents[-1]["author"] = dict(authors[documents[-1]["author_id"]])
+        return documents
+
     def get_all_tweets_count(self, hashtag, start_time=None, end_time=None):
         params = {
             "granularity": "day"
@@ -150,24 +181,93 @@ class Twitter:
             params["start_time"] = start_time
         if end_time is not None:
             params["end_time"] = end_time
+        for res in self.__count_pages(hashtag, params):
+            total_tweet_count += dict(res.meta)["total_tweet_count"]
+        return total_tweet_count
+
+    def __count_pages(self, hashtag, params):
         cursor = None
         while True:
-            try:
-                if cursor is None:
-                    if "next_token" in params:
-                        del params["next_token"]
-                else:
-                    params["next_token"] = cursor
-                res = self.client.get_all_tweets_count(hashtag, **params)
-                print(res)
-            except Exception as e:
-                print(f"Server error. {e} Sleeping for 10sec ...")
-                sleep(10)
-                continue
+            if cursor is None:
+                if "next_token" in params:
+                    del params["next_token"]
+            else:
+                params["next_token"] = cursor
+            res = self.scheduler.call("get_all_tweets_count", self.client.get_all_tweets_count, hashtag, **params)
+            metrics.count("twitter.results", len(res.data or []), endpoint="get_all_tweets_count")
+            yield res
             meta = dict(res.meta)
-            total_tweet_count += meta["total_tweet_count"]
             if "next_token" in meta:
                 cursor = meta["next_token"]
             else:
                 break
-        return total_tweet_count
+
+    @staticmethod
+    def __split_windows(buckets, windows):
+        total = sum(bucket["tweet_count"] for bucket in buckets)
+        split, start, count = [], None, 0
+        for bucket in buckets:
+            if start is None:
+                start = bucket["start"]
+            count += bucket["tweet_count"]
+            if count >= total * (len(split) + 1) / windows and len(split) < windows - 1:
+                split.append((start, bucket["end"]))
+                start = None
+        if start is not None:
+            split.append((start, buckets[-1]["end"]))
+        return split
+
+    def __backfill_window(self, hashtag, window):
+        key = f"{hashtag}|{window[0]}|{window[1]}"
+        checkpoint = self.mongodb.get_cursor(key)
+        cursor = None
+        if checkpoint is not None:
+            cursor = checkpoint["next_cursor"]
+            if cursor is None:
+                return 0
+        params = self.__search_params()
+        params["start_time"] = window[0]
+        params["end_time"] = window[1]
+        inserted = 0
+        for res in self.__search_pages(hashtag, params, cursor):
+            inserted += self.mongodb.insert_new(hashtag, self.__tweet_documents(res))
+            meta = dict(res.meta)
+            self.mongodb.update_metadata(key, str(cursor), str(meta["next_token"]) if "next_token" in meta else None)
+            cursor = meta.get("next_token")
+        return inserted
+
+    def backfill_hashtag(self, hashtag, start_time=None, end_time=None, windows=8, workers=4):
+        if hashtag is None or type(hashtag) != str:
+            raise Exception("Hashtag cannot be none and must be a string")
+        elif not hashtag.startswith("#"):
+            raise Exception(f"The hashtag {hashtag} must start with `#`")
+        # The plan is saved on the first run and reused on resume. Recounting would move the window boundaries, and
+        # the checkpoints of the old windows would then never be found again. Like a window checkpoint, a finished
+        # plan has no `next_cursor`, and a later call plans again up to a new end time.
+        plan_key = f"{hashtag}|{start_time}|{end_time}"
+        plan = self.mongodb.get_cursor(plan_key)
+        if plan is not None and plan["next_cursor"] is not None:
+            plan = plan["cursor"]
+            split = json.loads(plan)["windows"]
+        else:
+            if end_time is None:
+                # Pinned to the first run, the API accepts end times up to 10 seconds before now.
+                end_time = (datetime.now(timezone.utc) - timedelta(seconds=30)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            params = {"granularity": "day", "end_time": end_time}
+            if start_time is not None:
+                params["start_time"] = start_time
+            print(f"Counting tweets containing {hashtag} ...")
+            buckets = [dict(bucket) for res in self.__count_pages(hashtag, params) for bucket in (res.data or [])]
+            if not len(buckets):
+                return 0
+            buckets.sort(key=lambda bucket: bucket["start"])
+            split = self.__split_windows(buckets, windows)
+            plan = json.dumps({"end_time": end_time, "windows": split})
+            self.mongodb.update_metadata(plan_key, plan, "pending")
+        print(f"Backfilling {hashtag} in {len(split)} windows ...")
+        self.mongodb.ensure_indexes(hashtag, wait=True)
+        with ThreadPoolExecutor(workers) as executor:
+            inserted = sum(executor.map(lambda window: self.__backfill_window(hashtag, window), split))
+        self.mongodb.update_metadata(plan_key, plan, None)
+        print(f"Inserted {inserted} tweets containing {hashtag}.")
+        return inserted